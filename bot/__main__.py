@@ -1,13 +1,18 @@
 import asyncio
-import bot.resume_toucher
 import sys
 
 if __name__ == '__main__':
     loop = asyncio.get_event_loop()
 
+    # entry points are imported lazily, so that each process loads only its own dependencies
     if len(sys.argv) > 1 and sys.argv[1] == 'touch':
+        import bot.resume_toucher
         loop.create_task(bot.resume_toucher.main())
+    elif len(sys.argv) > 1 and sys.argv[1] == 'validate':
+        import bot.token_validator
+        loop.create_task(bot.token_validator.main())
     else:
-        loop.create_task(bot.main())
+        import bot.chat
+        loop.create_task(bot.chat.main())
 
     loop.run_forever()
@@ -0,0 +1,365 @@
+from typing import Dict, List, Optional, Tuple
+import os
+import re
+import random
+import asyncio
+import telepot
+from bot.hh_api import HeadHunterAPI, HeadHunterAuthError, HeadHunterRequestError, HeadHunterUnavailableError, hh_breaker
+from bot.conversation import ConversationStateStore
+from bot.db import postgres_connect, postgres_create_tables
+from bot.log import get_logger
+from bot.profiling import dump_periodically, traced
+from bot.telegram import get_bot, send_message
+from bot.timestamps import utcnow
+import bot.models
+from telepot.aio.loop import MessageLoop
+
+log = get_logger('chat')
+
+HH_MAX_CONCURRENT_COMMANDS = int(os.environ.get('HH_MAX_CONCURRENT_COMMANDS', 20))
+"""Сколько команд, которым нужен hh.ru, может выполняться одновременно; остальным сразу отвечаем отказом."""
+
+RECORD_UPDATES = os.environ.get('RECORD_UPDATES')
+"""Файл для записи входящих сообщений (см. bot.replay); не задан — не записывать."""
+
+RESUME_LIST_CACHE_TTL = int(os.environ.get('RESUME_LIST_CACHE_TTL_SECONDS', 60 * 60))
+"""Сколько показывать сохраненный список резюме, пока hh.ru недоступен, в секундах."""
+
+token_pattern = re.compile(r"^[A-Z0-9]{64}$")
+conversation_states = ConversationStateStore()
+
+hh_commands_in_flight = 0
+resume_list_cache: Dict[int, Tuple[float, str]] = {}
+"""Последний показанный список резюме: время по часам event loop и текст сообщения."""
+
+
+incorrect_message_answers = [
+    'Извини, не понимаю. Отправь /help, чтобы увидеть полный список моих команд.',
+    'Сложно, не понятно. Отправь /help, чтобы увидеть полный список моих команд.',
+    'Я не знаю такой команды. Отправь /help, чтобы увидеть полный список моих команд.',
+]
+
+hello_message = ('Привет! Я регулярно (примерно раз в четыре часа) буду поднимать твоё резюме в поиске на hh.ru, '
+                 'чтобы его увидело большее количество работодателей. '
+                 'И тебе даже не придется платить за это ни рубля! :)\n\n'
+                 
+                 '<b>Важное замечание</b>\n'
+                 'Наверняка ребята из hh.ru не обрадуются, что я предоставляю такие услуги бесплатно, '
+                 'ведь они берут за это деньги '
+                 '(см. цены <a href="https://hh.ru/applicant/resume_service/renewresume">здесь</a>). '
+                 'Поэтому я не могу просто создать "приложение", использующее API hh.ru — его заблокируют. '
+                 'Но при этом hh.ru открыто предоставляет пользователям API и не запрещает писать скрипты для '
+                 'любых своих целей, которые не противоречат правилам. Поэтому мне нужен твой авторизационный токен, '
+                 'чтобы производить обновление резюме от твоего лица. '
+                 'Я, конечно, буду использовать этот токен ТОЛЬКО для поднятия твоих резюме в поиске, '
+                 'честно-честно, но ты должен понимать, что вообще-то передавать свой авторизационный токен '
+                 'третьим лицам — небезопасно. Помни, что ты используешь этого бота на свой страх и риск. '
+                 'Кстати, токен в любой момент можно отозвать, нажав на иконку "корзины" напротив токена на hh.ru, '
+                 'и я настоятельно рекомендую тебе так и поступить, как только мои услуги станут тебе не нужны. '
+                 'Кроме того, мой исходный код (на Python) ты всегда можешь посмотреть здесь: '
+                 'https://github.com/BrokeRU/hh_update_bot.\n\n'
+                 
+                 'Итак, план действий следующий:\n'
+                 '1. Авторизоваться на hh.ru;\n'
+                 '2. Перейти по ссылке: https://dev.hh.ru/admin;\n'
+                 '3. Нажать кнопку "Запросить токен";\n'
+                 '4. Скопировать <code>access_token</code> (64 символа) и отправить мне.\n\n'
+                 )
+help_message = ('/start — приветственное сообщение;\n'
+                '/help — список доступных команд;\n'
+                '/token — сменить токен для доступа к hh.ru;\n'
+                '/cancel — отменить ввод токена;\n'
+                '/resumes — получить список доступных резюме;\n'
+                '/active — получить список продвигаемых резюме;\n'
+                '/extend — продлить продвижение всех резюме ещё на неделю.'
+                )
+new_token_message = ('Отправь мне токен для доступа к hh.ru. Напоминаю, что токен можно взять отсюда: '
+                     'https://dev.hh.ru/admin. Если передумал, то отправь /cancel.')
+new_token_cancel_message = 'Установка нового токена отменена.'
+token_incorrect_message = 'Неправильный токен. Ты уверен, что скопировал всё правильно?'
+no_resumes_available_message = 'Нет ни одного резюме! Добавь резюме (а лучше несколько) на hh.ru и попробуй снова.'
+select_resume_message = 'Выбери одно или несколько резюме, которые будем продвигать в поиске.\n\n'
+resume_selected_message = ('Ок, резюме <b>"{title}"</b> будет регулярно подниматься в поиске каждые четыре часа в '
+                           'течение одной недели. Через неделю тебе нужно будет написать мне, '
+                           'чтобы продолжить поднимать резюме. Я предупрежу тебя. Желаю найти работу мечты!')
+resumes_selected_message = ('Ок, эти резюме будут регулярно подниматься в поиске каждые четыре часа в '
+                            'течение одной недели:\n\n{titles}\n\n'
+                            'Через неделю тебе нужно будет написать мне, '
+                            'чтобы продолжить поднимать резюме. Я предупрежу тебя. Желаю найти работу мечты!')
+select_all_resumes_message = '\n\nВыбрать все резюме сразу: /resume_all'
+active_resumes_message = 'Продвигаемые резюме:\n\n'
+resume_not_found_message = 'Резюме не найдено.'
+resume_deactivated_message = 'Резюме больше не будет подниматься в поиске.'
+hh_unavailable_message = 'hh.ru сейчас отвечает с перебоями. Попробуй, пожалуйста, ещё раз через несколько минут.'
+cached_resume_list_message = '\n\n<i>hh.ru сейчас отвечает с перебоями, поэтому список может быть устаревшим.</i>'
+resumes_extended_message = 'Продвижение продлено ещё на неделю:\n\n'
+no_active_resumes_message = 'Нет ни одного продвигаемого резюме. Выбери резюме командой /resumes.'
+
+
+async def on_unknown_message(chat_id):
+    msg = random.choice(incorrect_message_answers)
+    await send_message(chat_id, msg)
+
+
+@traced()
+async def on_chat_message(msg):
+    content_type, chat_type, user_id = telepot.glance(msg)
+    log.info('Chat message', extra={'content_type': content_type, 'chat_type': chat_type, 'user_id': user_id})
+    log.debug(msg)
+
+    # answer in private chats only
+    if chat_type != 'private':
+        return
+
+    # answer for text messages only
+    if content_type != 'text':
+        return await on_unknown_message(user_id)
+
+    # check if user is new
+    user = await bot.models.TelegramUser.get(int(user_id))
+
+    # unknown user
+    if not user:
+        log.info('Unknown user', extra={'user_id': user_id})
+        user = bot.models.TelegramUser(
+            user_id=int(user_id)
+        )
+        await user.create()
+        await send_message(user_id, hello_message)
+        return
+
+    # known user
+    log.debug('Known user', extra={'user_id': user_id})
+    user.is_waiting_for_token = conversation_states.get(user.user_id, user.is_waiting_for_token)
+
+    command = msg['text'].lower()
+
+    if command == '/start':
+        await send_message(user_id, hello_message)
+    elif command == '/help':
+        await send_message(user_id, help_message)
+    elif command == '/token':
+        # wait for token
+        conversation_states.set(user.user_id, True)
+        await send_message(user_id, new_token_message)
+    elif command == '/cancel':
+        # cancel waiting for token
+        conversation_states.set(user.user_id, False)
+        await send_message(user_id, new_token_cancel_message)
+    elif command == '/resumes':
+        await run_hh_command(user_id, get_resume_list, user, fallback=get_cached_resume_list(user_id))
+    elif command == '/active':
+        await get_active_resume_list(user)
+    elif command == '/extend':
+        await extend_resumes(user)
+    elif command.startswith('/resume_'):
+        resume_ids = [r for r in dict.fromkeys(command.split('_')[1:]) if r]
+        await run_hh_command(user_id, activate_resumes, user, resume_ids)
+    elif command.startswith('/deactivate_'):
+        resume_id = command.split('_')[1]
+        await deactivate_resume(user, resume_id)
+    elif user.is_waiting_for_token:
+        token = msg['text'].upper()
+        await run_hh_command(user_id, save_token, user, token)
+    else:
+        await on_unknown_message(user_id)
+
+
+async def run_hh_command(user_id, handler, *args, fallback: Optional[str]=None) -> None:
+    """Выполняет обработчик команды, которому нужен hh.ru, с контролем допуска.
+
+    Если предохранитель hh.ru открыт или одновременно выполняется слишком много таких команд,
+    обработчик не вызывается, а пользователь сразу получает fallback или просьбу повторить позже.
+    """
+    global hh_commands_in_flight
+
+    if not hh_breaker.is_available() or hh_commands_in_flight >= HH_MAX_CONCURRENT_COMMANDS:
+        log.info('HH command rejected', extra={'user_id': user_id, 'in_flight': hh_commands_in_flight})
+        await send_message(user_id, fallback or hh_unavailable_message)
+        return
+
+    hh_commands_in_flight += 1
+    try:
+        await handler(*args)
+    except (HeadHunterUnavailableError, HeadHunterRequestError):
+        await send_message(user_id, fallback or hh_unavailable_message)
+    finally:
+        hh_commands_in_flight -= 1
+
+
+def get_cached_resume_list(user_id) -> Optional[str]:
+    cached = resume_list_cache.get(user_id)
+    if not cached:
+        return None
+
+    cached_at, msg = cached
+    if asyncio.get_event_loop().time() - cached_at > RESUME_LIST_CACHE_TTL:
+        del resume_list_cache[user_id]
+        return None
+
+    return msg + cached_resume_list_message
+
+
+async def activate_resumes(user: bot.models.TelegramUser, resume_ids: List[str]) -> None:
+    """Активирует одно или несколько резюме (/resume_<id>[_<id>...]) или все резюме пользователя (/resume_all)."""
+    assert user.user_id
+    assert user.hh_token
+
+    user_id = user.user_id
+    hh_token = user.hh_token
+
+    resumes: List[bot.models.HeadHunterResume]
+
+    try:
+        async with await HeadHunterAPI.create(hh_token) as api:
+            if resume_ids == ['all']:
+                resumes = await api.get_resume_list()
+            else:
+                resumes = await api.get_resumes(resume_ids)
+    except HeadHunterAuthError:
+        await send_message(user_id, token_incorrect_message)
+        return
+
+    if not resumes:
+        await send_message(user_id, resume_not_found_message)
+        return
+
+    # set user_id
+    for resume in resumes:
+        resume.user_id = user_id
+
+    await bot.models.HeadHunterResume.activate_many(resumes)
+
+    if len(resumes) == 1:
+        await send_message(user_id, resume_selected_message.format(title=resumes[0].title))
+    else:
+        titles = '\n'.join(f'<b>{r.title}</b>' for r in resumes)
+        await send_message(user_id, resumes_selected_message.format(titles=titles))
+
+
+async def deactivate_resume(user: bot.models.TelegramUser, resume_id: str) -> None:
+    assert user.user_id
+
+    user_id = user.user_id
+
+    resume: bot.models.HeadHunterResume = await bot.models.HeadHunterResume.get(resume_id)
+
+    if resume:
+        await resume.deactivate()
+        await send_message(user_id, resume_deactivated_message)
+    else:
+        await send_message(user_id, resume_not_found_message)
+
+
+async def get_active_resume_list(user: bot.models.TelegramUser) -> None:
+    assert user.user_id
+
+    user_id = user.user_id
+
+    active_resumes = await bot.models.HeadHunterResume.get_user_active_resume_list(user)
+
+    msg = active_resumes_message
+    if active_resumes:
+        msg += '\n\n'.join(f'<b>{r.title}</b>\n/deactivate_{r.resume_id}' for r in active_resumes)
+    else:
+        msg += '<b>Список пуст!</b>'
+
+    await send_message(user_id, msg)
+
+
+async def extend_resumes(user: bot.models.TelegramUser) -> None:
+    assert user.user_id
+
+    user_id = user.user_id
+
+    extended_resumes = await bot.models.HeadHunterResume.extend_user_resume_list(user)
+
+    if extended_resumes:
+        msg = resumes_extended_message
+        msg += '\n'.join(f'<b>{r.title}</b>' for r in extended_resumes)
+    else:
+        msg = no_active_resumes_message
+
+    await send_message(user_id, msg)
+
+
+async def save_token(user: bot.models.TelegramUser, hh_token: str) -> None:
+    assert user.user_id
+
+    user_id = user.user_id
+
+    if not token_pattern.match(hh_token):
+        # token mismatched pattern
+        log.info('Token NOT matched pattern', extra={'user_id': user_id})
+        await send_message(user_id, token_incorrect_message)
+        return
+
+    log.info('Token matched pattern', extra={'user_id': user_id})
+
+    # create API object
+    try:
+        async with await HeadHunterAPI.create(hh_token) as api:
+            # update user object
+            user.hh_token = hh_token
+            user.is_waiting_for_token = False
+            user.first_name = api.first_name
+            user.last_name = api.last_name
+            user.email = api.email
+            user.is_token_valid = True
+            user.token_checked_at = utcnow()
+            conversation_states.set(user.user_id, False)
+            await user.update()
+    except HeadHunterAuthError:
+        await send_message(user_id, token_incorrect_message)
+        return
+
+    await get_resume_list(user)
+
+
+async def get_resume_list(user: bot.models.TelegramUser) -> None:
+    assert user.user_id
+    assert user.hh_token
+
+    user_id = user.user_id
+    hh_token = user.hh_token
+
+    log.info('Get resume list', extra={'user_id': user_id})
+
+    try:
+        async with await HeadHunterAPI.create(hh_token) as api:
+            # get resume list
+            resumes: List[bot.models.HeadHunterResume] = await api.get_resume_list()
+
+            if resumes:
+                msg = select_resume_message
+                msg += '\n\n'.join(f'<b>{r.title}</b>\n/resume_{r.resume_id}' for r in resumes)
+                if len(resumes) > 1:
+                    msg += select_all_resumes_message
+                resume_list_cache[user_id] = (asyncio.get_event_loop().time(), msg)
+                await send_message(user_id, msg)
+            else:
+                # no available resumes
+                await send_message(user_id, no_resumes_available_message)
+    except HeadHunterAuthError:
+        await send_message(user_id, token_incorrect_message)
+        return
+
+
+async def main():
+    tg_bot = get_bot()
+
+    loop = asyncio.get_event_loop()
+
+    await postgres_connect()
+    await postgres_create_tables()
+
+    handler = on_chat_message
+    if RECORD_UPDATES:
+        from bot.replay import record_updates
+        handler = record_updates(handler, RECORD_UPDATES)
+
+    loop.create_task(MessageLoop(tg_bot, {'chat': handler}).run_forever())
+    loop.create_task(dump_periodically('chat'))
+    loop.create_task(conversation_states.run())
+
+    log.info('Listening for messages in Telegram...')
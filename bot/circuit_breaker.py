@@ -0,0 +1,86 @@
+from typing import Optional
+from collections import deque
+import time
+
+CALL = 'call'
+"""Обычный вызов при закрытом предохранителе."""
+
+PROBE = 'probe'
+"""Пробный вызов при полуоткрытом предохранителе."""
+
+
+class CircuitBreaker:
+    """Предохранитель для внешнего сервиса.
+
+    Состояния:
+    * закрыт — вызовы разрешены, исходы последних window вызовов запоминаются;
+    * открыт — если среди последних вызовов (не меньше min_calls) доля неудачных или медленных
+      достигла failure_ratio, вызовы запрещаются на open_seconds;
+    * полуоткрыт — по истечении open_seconds разрешается один пробный вызов: если он удачен,
+      предохранитель закрывается, иначе снова открывается.
+    """
+
+    def __init__(self, window: int=20, min_calls: int=10, failure_ratio: float=0.5, open_seconds: float=30):
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.open_seconds = open_seconds
+
+        self.outcomes = deque(maxlen=window)
+        self.opened_until: float = None
+        self.is_probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_until is not None and time.monotonic() < self.opened_until
+
+    def is_available(self) -> bool:
+        """Можно ли сейчас рассчитывать на сервис (для быстрого отказа без вызова)."""
+        return not self.is_open and not self.is_probing
+
+    def before_call(self) -> Optional[str]:
+        """Разрешает или запрещает очередной вызов.
+
+        :return: None, если вызов запрещен; иначе CALL или PROBE, которое нужно передать в record()
+        """
+        if self.opened_until is None:
+            return CALL
+        if self.is_open or self.is_probing:
+            return None
+
+        # half-open: let a single probe through
+        self.is_probing = True
+        return PROBE
+
+    def record(self, call: str, is_failure: bool) -> None:
+        """Запоминает исход вызова: ошибку, таймаут или слишком долгий ответ считать неудачей.
+
+        :param call: значение, которое вернул before_call()
+        :param is_failure: неудачен ли вызов
+        """
+        if call == PROBE:
+            self.is_probing = False
+            if is_failure:
+                self.trip()
+            else:
+                self.opened_until = None
+                self.outcomes.clear()
+            return
+
+        if self.opened_until is not None:
+            # the call started before the breaker had opened
+            return
+
+        self.outcomes.append(is_failure)
+        if len(self.outcomes) >= self.min_calls and sum(self.outcomes) >= self.failure_ratio * len(self.outcomes):
+            self.trip()
+
+    def trip(self) -> None:
+        self.opened_until = time.monotonic() + self.open_seconds
+
+    def release(self, call: str) -> None:
+        """Завершает вызов без исхода (например, отмененный): пробный вызов будет разрешен снова.
+
+        :param call: значение, которое вернул before_call()
+        """
+        if call == PROBE:
+            self.is_probing = False
@@ -0,0 +1,54 @@
+from typing import Dict
+import asyncio
+import os
+from bot.log import get_logger
+from bot.models import TelegramUser, UserID
+
+log = get_logger('conversation')
+
+FLUSH_INTERVAL = float(os.environ.get('CONVERSATION_FLUSH_INTERVAL_SECONDS', 1))
+"""Как часто записывать изменения состояния диалога в БД, в секундах."""
+
+
+class ConversationStateStore:
+    """Состояние диалога (ожидается ли токен) с отложенной пакетной записью в БД.
+
+    Обработчики команд меняют состояние в памяти и отвечают сразу; изменения записываются
+    одним запросом раз в FLUSH_INTERVAL. В памяти хранятся только ещё не записанные изменения,
+    остальное берется из public.user, поэтому после перезапуска состояние восстанавливается из БД
+    (теряются лишь изменения последнего интервала).
+    """
+
+    def __init__(self):
+        self.pending: Dict[UserID, bool] = {}
+
+    def get(self, user_id: UserID, default: bool) -> bool:
+        """Возвращает состояние пользователя.
+
+        :param user_id: идентификатор пользователя
+        :param default: значение из БД, если незаписанных изменений нет
+        """
+        return self.pending.get(user_id, default)
+
+    def set(self, user_id: UserID, is_waiting_for_token: bool) -> None:
+        self.pending[user_id] = is_waiting_for_token
+
+    async def flush(self) -> None:
+        if not self.pending:
+            return
+
+        batch = dict(self.pending)
+        await TelegramUser.update_waiting_for_token(batch)
+
+        # keep changes made while the batch was being written
+        for user_id, is_waiting_for_token in batch.items():
+            if self.pending.get(user_id) == is_waiting_for_token:
+                del self.pending[user_id]
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                log.error(f'Error saving conversation states: {e!r}')
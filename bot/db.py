@@ -0,0 +1,32 @@
+import os
+import aiopg
+from bot.log import get_logger
+
+log = get_logger('db')
+
+pg_pool = None
+
+
+async def postgres_connect() -> None:
+    global pg_pool
+
+    log.info("Connecting to PostgreSQL...")
+
+    # get environment variables
+    PG_HOST: str = os.environ['POSTGRES_HOST']
+    PG_PORT: str = os.environ['POSTGRES_PORT']
+    PG_DB: str = os.environ['POSTGRES_DB']
+    PG_USER: str = os.environ['POSTGRES_USER']
+    PG_PASSWORD: str = os.environ['POSTGRES_PASSWORD']
+
+    # see: https://www.postgresql.org/docs/current/static/libpq-connect.html#LIBPQ-CONNSTRING
+    dsn: str = f'dbname={PG_DB} user={PG_USER} password={PG_PASSWORD} host={PG_HOST} port={PG_PORT}'
+
+    pg_pool = await aiopg.create_pool(dsn)
+
+
+async def postgres_create_tables() -> None:
+    import bot.models
+
+    await bot.models.TelegramUser.create_table()
+    await bot.models.HeadHunterResume.create_table()
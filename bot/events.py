@@ -0,0 +1,63 @@
+from typing import AsyncIterator, List
+import asyncio
+import os
+from bot import db
+from bot.log import get_logger
+
+log = get_logger('events')
+
+RESUME_ACTIVATED_CHANNEL = 'resume_activated'
+"""Канал PostgreSQL NOTIFY: резюме активировано пользователем, полезная нагрузка — идентификатор резюме."""
+
+LISTEN_PING_INTERVAL = int(os.environ.get('EVENTS_PING_INTERVAL_SECONDS', 60))
+"""Если событий нет дольше этого времени, соединение слушателя проверяется запросом, в секундах."""
+
+
+async def notify(channel: str, payload: str) -> None:
+    """Отправляет событие всем процессам, слушающим канал (см. listen)."""
+    async with db.pg_pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            log.debug('Events: Notifying...', extra={'channel': channel, 'payload': payload})
+            await cur.execute('SELECT pg_notify(%(channel)s, %(payload)s);', {'channel': channel, 'payload': payload})
+
+
+async def notify_many(channel: str, payloads: List[str]) -> None:
+    """Отправляет несколько событий одним запросом."""
+    async with db.pg_pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            log.debug('Events: Notifying...', extra={'channel': channel, 'count': len(payloads)})
+            await cur.execute(
+                'SELECT pg_notify(%(channel)s, payload) FROM unnest(%(payloads)s::text[]) AS payload;',
+                {'channel': channel, 'payloads': payloads}
+            )
+
+
+async def listen(channel: str) -> AsyncIterator[str]:
+    """Возвращает полезную нагрузку событий канала по мере их поступления.
+
+    На всё время прослушивания занимает одно соединение из пула.
+    События, отправленные, пока никто не слушает, теряются.
+
+    Обрыв соединения не проявляется при ожидании событий, поэтому в паузах между ними
+    соединение проверяется запросом: если он не удался, генератор завершается исключением,
+    и вызывающий код может подписаться заново.
+    """
+    async with db.pg_pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(f'LISTEN {channel};')
+
+        log.info('Events: Listening...', extra={'channel': channel})
+
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(conn.notifies.get(), LISTEN_PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    async with conn.cursor() as cur:
+                        await cur.execute('SELECT 1;')
+                    continue
+                yield message.payload
+        finally:
+            if not conn.closed:
+                async with conn.cursor() as cur:
+                    await cur.execute(f'UNLISTEN {channel};')
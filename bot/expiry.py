@@ -0,0 +1,78 @@
+from typing import Dict, List
+import asyncio
+import os
+from datetime import timedelta
+from bot.log import get_logger
+from bot.models import HeadHunterResume, UserID
+from bot.telegram import send_messages
+from bot.timestamps import utcnow
+
+log = get_logger('expiry')
+
+EXPIRY_WARNING_BEFORE = timedelta(hours=int(os.environ.get('EXPIRY_WARNING_BEFORE_HOURS', 24)))
+"""За сколько до окончания срока продвижения предупреждать пользователя."""
+
+EXPIRY_CHECK_INTERVAL = int(os.environ.get('EXPIRY_CHECK_INTERVAL_SECONDS', 10 * 60))
+"""Как часто искать истекающие и истекшие резюме, в секундах."""
+
+expiry_warning_message = ('Скоро закончится продвижение резюме:\n\n'
+                          '{titles}\n\n'
+                          'Отправь /extend, чтобы продлить продвижение всех резюме ещё на неделю.')
+resume_timed_out_message = ('Продвижение твоих резюме было автоматически прекращено:\n\n'
+                            '{titles}\n\n'
+                            'Чтобы возобновить его, выбери резюме командой /resumes.')
+
+
+def group_by_user(resumes: List[HeadHunterResume]) -> Dict[UserID, List[HeadHunterResume]]:
+    users: Dict[UserID, List[HeadHunterResume]] = {}
+    for resume in resumes:
+        users.setdefault(resume.user_id, []).append(resume)
+    return users
+
+
+def format_titles(resumes: List[HeadHunterResume]) -> str:
+    return '\n'.join(f'<b>{r.title}</b>' for r in resumes)
+
+
+async def notify_expiring_resumes() -> None:
+    """Одно сообщение каждому пользователю, у которого скоро истекает срок продвижения резюме.
+
+    Резюме отмечаются предупрежденными только после успешной отправки: если сообщение
+    не дошло, предупреждение будет отправлено при следующей проверке.
+    """
+    deadline = utcnow() + EXPIRY_WARNING_BEFORE
+    users = group_by_user(await HeadHunterResume.get_expiring_resume_list(deadline))
+    log.info('Expiring resumes', extra={'users': len(users)})
+
+    delivered = await send_messages(
+        (user_id, expiry_warning_message.format(titles=format_titles(resumes)))
+        for user_id, resumes in users.items()
+    )
+
+    await HeadHunterResume.mark_expiry_warned(
+        [resume.resume_id for user_id in delivered for resume in users[user_id]],
+        deadline
+    )
+
+
+async def deactivate_timed_out_resumes() -> None:
+    """Деактивирует резюме с истекшим сроком и отправляет одно сообщение каждому их владельцу."""
+    users = group_by_user(await HeadHunterResume.take_timed_out_resume_list())
+    log.info('Timed out resumes', extra={'users': len(users)})
+
+    await send_messages(
+        (user_id, resume_timed_out_message.format(titles=format_titles(resumes)))
+        for user_id, resumes in users.items()
+    )
+
+
+async def run() -> None:
+    """Периодически обрабатывает истекшие и истекающие резюме, независимо от циклов поднятия."""
+    while True:
+        try:
+            await deactivate_timed_out_resumes()
+            await notify_expiring_resumes()
+        except Exception as e:
+            log.error(f'Error processing expiring resumes: {e!r}')
+
+        await asyncio.sleep(EXPIRY_CHECK_INTERVAL)
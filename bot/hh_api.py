@@ -1,15 +1,55 @@
-from typing import Dict, List, Tuple
-from aiohttp.client import ClientSession
-import dateutil.parser
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+from aiohttp.client import ClientSession, ClientError, ClientTimeout
+from multidict import CIMultiDictProxy
 import bot.models
+from bot.circuit_breaker import CircuitBreaker
+from bot.profiling import traced
+from bot.timestamps import parse_datetime
 
 APIToken = str
 
+HH_TIMEOUT = float(os.environ.get('HH_TIMEOUT_SECONDS', 10))
+"""Таймаут одного запроса к API hh.ru, в секундах."""
+
+HH_FETCH_CONCURRENCY = int(os.environ.get('HH_FETCH_CONCURRENCY', 5))
+"""Сколько резюме одного пользователя запрашивать из hh.ru одновременно."""
+
+HH_SLOW_SECONDS = float(os.environ.get('HH_SLOW_SECONDS', 3))
+"""Ответ дольше этого времени считается признаком деградации hh.ru, в секундах."""
+
+hh_breaker = CircuitBreaker(
+    window=int(os.environ.get('HH_BREAKER_WINDOW', 20)),
+    min_calls=int(os.environ.get('HH_BREAKER_MIN_CALLS', 10)),
+    failure_ratio=float(os.environ.get('HH_BREAKER_FAILURE_RATIO', 0.5)),
+    open_seconds=float(os.environ.get('HH_BREAKER_OPEN_SECONDS', 30))
+)
+"""Предохранитель для всех запросов к API hh.ru из этого процесса."""
+
 
 class HeadHunterAuthError(Exception):
     """Ошибка авторизации в API hh.ru."""
 
 
+class HeadHunterRequestError(Exception):
+    """API hh.ru отклонило запрос не из-за авторизации (например, 400 или 429); токен при этом может быть действителен."""
+
+    def __init__(self, status: int):
+        super().__init__(f'HH responded {status}')
+        self.status = status
+
+
+class HeadHunterUnavailableError(Exception):
+    """API hh.ru недоступно, отвечает ошибками или слишком медленно (либо предохранитель открыт)."""
+
+
+class HeadHunterResumeNotFoundError(Exception):
+    """Резюме не найдено в API hh.ru."""
+
+
 class HeadHunterResumeUpdateTooOftenError(Exception):
     """Слишком частое обновление резюме в API hh.ru."""
 
@@ -23,6 +63,18 @@ class HeadHunterResumeUpdateError(Exception):
     * резюме находится на проверке у модератора."""
 
 
+class HeadHunterResponse:
+    """Полностью прочитанный ответ API hh.ru."""
+
+    def __init__(self, status: int, headers: CIMultiDictProxy, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8'))
+
+
 class HeadHunterAPI:
     """API для hh.ru.
 
@@ -39,20 +91,29 @@ class HeadHunterAPI:
     email: str
 
     @classmethod
-    async def create(cls, api_token: APIToken) -> 'HeadHunterAPI':
+    @traced()
+    async def create(cls, api_token: APIToken, check_token: bool=True) -> 'HeadHunterAPI':
         """Метод, создающий новый объект API hh.ru.
 
         :param api_token: токен для API; можно взять отсюда: https://dev.hh.ru/admin?new-token=true
+        :param check_token: проверить токен и получить данные о пользователе запросом к /me;
+            если False, то ошибка авторизации проявится только при первом запросе,
+            а first_name, last_name и email останутся незаполненными
         :raise HeadHunterAuthError: если произошла ошибка авторизации
+        :raise HeadHunterRequestError: если hh.ru отклонил запрос по другой причине
+        :raise HeadHunterUnavailableError: если hh.ru недоступен
         :return: объект типа HeadHunterAPI с данными о пользователе API
         """
         api = HeadHunterAPI()
         api.api_token = api_token
         api.headers = {'Authorization': f'Bearer {api_token}'}
-        api.session = ClientSession(headers=api.headers)
+        api.session = ClientSession(headers=api.headers, timeout=ClientTimeout(total=HH_TIMEOUT))
+        if not check_token:
+            return api
+
         try:
             await api.get_user_data()
-        except HeadHunterAuthError:
+        except BaseException:
             await api.session.close()
             raise
 
@@ -64,59 +125,205 @@ class HeadHunterAPI:
     async def __aexit__(self, exc_type, exc_value, exc_traceback):
         await self.session.close()
 
+    @staticmethod
+    @traced()
+    async def request(session: ClientSession, method: str, url: str, headers: Dict[str, str]=None) -> HeadHunterResponse:
+        """Выполняет запрос через предохранитель hh_breaker и читает ответ целиком.
+
+        Ошибки соединения, таймауты, ответы 5xx и ответы дольше HH_SLOW_SECONDS считаются неудачами.
+
+        :raise HeadHunterUnavailableError: если предохранитель открыт, запрос не удался или hh.ru ответил 5xx
+        :return: ответ
+        """
+        call = hh_breaker.before_call()
+        if call is None:
+            raise HeadHunterUnavailableError
+
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        try:
+            async with session.request(method, url, headers=headers) as resp:
+                response = HeadHunterResponse(resp.status, resp.headers, await resp.read())
+        except asyncio.CancelledError:
+            # says nothing about HH, but a probe must not stay in flight forever
+            hh_breaker.release(call)
+            raise
+        except (ClientError, asyncio.TimeoutError) as e:
+            hh_breaker.record(call, True)
+            raise HeadHunterUnavailableError from e
+        except BaseException:
+            hh_breaker.record(call, True)
+            raise
+
+        is_failure = response.status >= 500 or loop.time() - started > HH_SLOW_SECONDS
+        hh_breaker.record(call, is_failure)
+
+        if response.status >= 500:
+            raise HeadHunterUnavailableError
+
+        return response
+
     async def get_user_data(self) -> None:
         """Метод, получающий данные о пользователе API.
 
         См. https://github.com/hhru/api/blob/master/docs/me.md
 
         :raise HeadHunterAuthError: если произошла ошибка авторизации
+        :raise HeadHunterRequestError: если hh.ru отклонил запрос по другой причине
+        :raise HeadHunterUnavailableError: если hh.ru недоступен
         :return: None
         """
-        async with self.session.get(f'{self.api_url}/me') as resp:
-            if resp.status != 200:
-                raise HeadHunterAuthError
-            data = await resp.json()
-            self.first_name = data['first_name']
-            self.last_name = data['last_name']
-            self.email = data['email']
-
-    async def get_resume(self, resume_id: bot.models.ResumeID) -> bot.models.HeadHunterResume:
-        """
+        resp = await self.request(self.session, 'GET', f'{self.api_url}/me')
+        if resp.status in (401, 403):
+            raise HeadHunterAuthError
+        elif resp.status != 200:
+            raise HeadHunterRequestError(resp.status)
+        data = resp.json()
+        self.first_name = data['first_name']
+        self.last_name = data['last_name']
+        self.email = data['email']
 
-        :param resume_id:
-        :return:
-        """
-        async with self.session.get(f'{self.api_url}/resumes/{resume_id}') as resp:
-            if resp.status != 200:
-                raise HeadHunterAuthError
-            data = await resp.json()
-
-            return bot.models.HeadHunterResume(
-                resume_id=data['id'],
-                title=data['title'],
-                status=data['status']['id'],
-                access=data['access']['type']['id'],
-                next_publish_at=dateutil.parser.parse(data['next_publish_at'])
-            )
+    @classmethod
+    @traced()
+    async def check_token(cls, session: ClientSession, api_token: APIToken) -> Optional[bool]:
+        """Метод, проверяющий токен запросом к /me через общую для многих токенов сессию.
+
+        В отличие от create(), отличает отозванный токен от недоступности API.
 
+        :param session: сессия без заголовка авторизации
+        :param api_token: проверяемый токен
+        :return: True, если токен действителен; False, если hh.ru его отклонил; None, если проверить не удалось
+        """
+        headers = {'Authorization': f'Bearer {api_token}'}
+        try:
+            resp = await cls.request(session, 'GET', f'{cls.api_url}/me', headers)
+        except HeadHunterUnavailableError:
+            return None
+
+        if resp.status == 200:
+            return True
+        elif resp.status in (401, 403):
+            return False
+        return None
+
+    @traced()
+    async def get_resume(
+            self,
+            resume_id: bot.models.ResumeID,
+            cached: bot.models.HeadHunterResume=None
+    ) -> bot.models.HeadHunterResume:
+        """Метод, возвращающий резюме пользователя API.
+
+        См. https://github.com/hhru/api/blob/master/docs/resumes.md#item
+
+        Если передан сохраненный снимок резюме, запрос делается условным (If-None-Match,
+        If-Modified-Since). Если hh.ru ответил 304 или тело ответа совпало со снимком по хешу,
+        JSON не разбирается, а возвращается копия снимка с is_changed=False.
+
+        :param resume_id: идентификатор резюме
+        :param cached: сохраненное в БД резюме с заголовками и хешем прошлого ответа
+        :raise HeadHunterAuthError: если произошла ошибка авторизации
+        :raise HeadHunterResumeNotFoundError: если резюме не найдено
+        :raise HeadHunterRequestError: если hh.ru отклонил запрос по другой причине
+        :raise HeadHunterUnavailableError: если hh.ru недоступен
+        :return: резюме
+        """
+        headers = {}
+        if cached is not None and cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+
+        resp = await self.request(self.session, 'GET', f'{self.api_url}/resumes/{resume_id}', headers or None)
+        if resp.status == 304 and cached is not None:
+            return self.unchanged_resume(cached)
+        elif resp.status == 404:
+            raise HeadHunterResumeNotFoundError
+        elif resp.status in (401, 403):
+            raise HeadHunterAuthError
+        elif resp.status != 200:
+            raise HeadHunterRequestError(resp.status)
+
+        content_hash = hashlib.sha1(resp.body).hexdigest()
+        if cached is not None and cached.content_hash == content_hash:
+            return self.unchanged_resume(cached)
+
+        data = resp.json()
+
+        return bot.models.HeadHunterResume(
+            resume_id=data['id'],
+            title=data['title'],
+            status=data['status']['id'],
+            access=data['access']['type']['id'],
+            next_publish_at=parse_datetime(data['next_publish_at']),
+            etag=resp.headers.get('ETag'),
+            last_modified=resp.headers.get('Last-Modified'),
+            content_hash=content_hash
+        )
+
+    @staticmethod
+    def unchanged_resume(cached: bot.models.HeadHunterResume) -> bot.models.HeadHunterResume:
+        """Копия сохраненного снимка резюме, помеченная как неизменившаяся."""
+        resume = bot.models.HeadHunterResume(**cached.as_dict())
+        resume.is_changed = False
+        return resume
+
+    @traced()
     async def get_resume_list(self) -> List[bot.models.HeadHunterResume]:
         """Метод, возвращающий список резюме пользователя API.
 
         См. https://github.com/hhru/api/blob/master/docs/resumes.md#mine
 
         :raise HeadHunterAuthError: если произошла ошибка авторизации
+        :raise HeadHunterRequestError: если hh.ru отклонил запрос по другой причине
+        :raise HeadHunterUnavailableError: если hh.ru недоступен
         :return:
         """
-        async with self.session.get(f'{self.api_url}/resumes/mine') as resp:
-            if resp.status != 200:
-                raise HeadHunterAuthError
-            data = await resp.json()
+        resp = await self.request(self.session, 'GET', f'{self.api_url}/resumes/mine')
+        if resp.status in (401, 403):
+            raise HeadHunterAuthError
+        elif resp.status != 200:
+            raise HeadHunterRequestError(resp.status)
+        data = resp.json()
+
+        return await self.get_resumes([item['id'] for item in data['items']])
+
+    @traced()
+    async def get_resumes(self, resume_ids: List[bot.models.ResumeID]) -> List[bot.models.HeadHunterResume]:
+        """Метод, запрашивающий несколько резюме одновременно (не больше HH_FETCH_CONCURRENCY запросов сразу).
+
+        :param resume_ids: идентификаторы резюме
+        :raise HeadHunterAuthError: если произошла ошибка авторизации
+        :raise HeadHunterRequestError: если hh.ru отклонил запрос по другой причине
+        :raise HeadHunterUnavailableError: если hh.ru недоступен
+        :return: найденные резюме в порядке resume_ids; ненайденные пропускаются
+        """
+        semaphore = asyncio.Semaphore(HH_FETCH_CONCURRENCY)
+
+        async def fetch(resume_id: bot.models.ResumeID) -> Optional[bot.models.HeadHunterResume]:
+            async with semaphore:
+                try:
+                    return await self.get_resume(resume_id)
+                except HeadHunterResumeNotFoundError:
+                    return None
+
+        tasks = [asyncio.ensure_future(fetch(resume_id)) for resume_id in resume_ids]
+        try:
+            if tasks:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            # after the first failure the rest would only keep using a session that is about to be closed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        for task in tasks:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
 
-            return [
-                await self.get_resume(item['id'])
-                for item in data['items']
-            ]
+        return [task.result() for task in tasks if task.result() is not None]
 
+    @traced()
     async def touch_resume(self, resume: bot.models.HeadHunterResume) -> Tuple[bool, bot.models.HeadHunterResume]:
         """Метод, обновляющий время на указанном резюме.
 
@@ -124,15 +331,25 @@ class HeadHunterAPI:
 
         :param resume: резюме для обновления
         :raise HeadHunterAuthError: если произошла ошибка авторизации
+        :raise HeadHunterUnavailableError: если hh.ru недоступен
         :raise HeadHunterResumeUpdateError: если невозможно опубликовать резюме
+        :raise HeadHunterResumeNotFoundError: если резюме удалено с hh.ru
         :return: было ли резюме обновлено и новый объект резюме
         """
-        async with self.session.post(f'{self.api_url}/resumes/{resume.id}/publish') as resp:
-            if resp.status == 403:
-                raise HeadHunterAuthError
-            elif resp.status == 400:
-                raise HeadHunterResumeUpdateError
-            elif resp.status == 429:
-                return False, await self.get_resume(resume.id)
-
-            return True, await self.get_resume(resume.id)
+        resp = await self.request(self.session, 'POST', f'{self.api_url}/resumes/{resume.resume_id}/publish')
+        if resp.status in (401, 403):
+            raise HeadHunterAuthError
+        elif resp.status == 400:
+            raise HeadHunterResumeUpdateError
+        elif resp.status == 404:
+            raise HeadHunterResumeNotFoundError
+        has_updated = resp.status != 429
+
+        updated = await self.get_resume(resume.resume_id, cached=resume)
+
+        # fields below are stored by the bot only and are absent from the API response
+        updated.user_id = resume.user_id
+        updated.is_active = resume.is_active
+        updated.until = resume.until
+
+        return has_updated, updated
@@ -0,0 +1,167 @@
+"""Логирование: неблокирующая очередь, выборка, ограничение частоты и маскирование токенов.
+
+Все модули пишут в дочерние логгеры 'hh-update-bot' (см. get_logger), имя дочернего логгера —
+категория записи. Записи ниже WARNING проходят через фильтры выборки и ограничения частоты
+по категориям, затем из них вырезаются токены, и запись кладется в ограниченную очередь.
+Вывод в stderr выполняется отдельным потоком; если очередь переполнена, записи отбрасываются,
+а их количество сообщается следующей записью.
+
+Переменные окружения:
+* LOG_LEVEL — минимальный уровень (по умолчанию INFO);
+* LOG_FORMAT — text или json;
+* LOG_QUEUE_SIZE — размер очереди;
+* LOG_SAMPLE_RATES — доли записей по категориям, например: chat=0.1,models=0.01;
+* LOG_RATE_LIMIT — максимум записей в секунду на категорию; 0 — без ограничения.
+"""
+from typing import Dict, Tuple
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import time
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_SAMPLE_RATES: Dict[str, float] = {
+    category.strip(): float(rate)
+    for category, _, rate in (
+        item.partition('=') for item in os.environ.get('LOG_SAMPLE_RATES', '').split(',') if item
+    )
+}
+LOG_RATE_LIMIT = float(os.environ.get('LOG_RATE_LIMIT', 0))
+
+_token_pattern = re.compile(r'\b[A-Za-z0-9]{64}\b')
+_bearer_pattern = re.compile(r'(Bearer\s+)\S+')
+
+_standard_attributes = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def category_of(record: logging.LogRecord) -> str:
+    """Категория записи: имя дочернего логгера относительно 'hh-update-bot'."""
+    return record.name[len(log.name) + 1:]
+
+
+def redact(text: str) -> str:
+    text = _token_pattern.sub('***', text)
+    return _bearer_pattern.sub(r'\1***', text)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает заданную долю записей ниже WARNING в каждой категории."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(category_of(record))
+        return rate is None or random.random() < rate
+
+
+class RateLimitFilter(logging.Filter):
+    """Ограничивает количество записей ниже WARNING в секунду в каждой категории (token bucket)."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.burst = max(1.0, rate)
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rate:
+            return True
+
+        category = category_of(record)
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(category, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+        if tokens < 1:
+            self.buckets[category] = (tokens, now)
+            return False
+
+        self.buckets[category] = (tokens - 1, now)
+        return True
+
+
+class RedactingFilter(logging.Filter):
+    """Вырезает токены hh.ru из текста записи."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = redact(record.getMessage())
+        record.args = None
+        return True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не блокируется и не падает при переполнении очереди, а отбрасывает записи."""
+
+    dropped: int = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.LogRecord(
+                    log.name, logging.WARNING, __file__, 0,
+                    f'{self.dropped} log records dropped: queue is full', None, None
+                ))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StructuredFormatter(logging.Formatter):
+    """Добавляет к записи поля, переданные через extra: в виде key=value или JSON."""
+
+    def __init__(self, is_json: bool):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.is_json = is_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {k: v for k, v in vars(record).items() if k not in _standard_attributes}
+
+        if self.is_json:
+            data = {
+                'time': self.formatTime(record),
+                'logger': record.name,
+                'level': record.levelname,
+                'message': record.getMessage(),
+            }
+            data.update(fields)
+            return redact(json.dumps(data, ensure_ascii=False, default=str))
+
+        text = super().format(record)
+        if fields:
+            text += ' ' + ' '.join(f'{k}={v}' for k, v in fields.items())
+        # the traceback is formatted here, after RedactingFilter has run
+        return redact(text)
+
+
+log = logging.getLogger('hh-update-bot')
+log.setLevel(LOG_LEVEL)
+
+handler = BoundedQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+handler.addFilter(SamplingFilter(LOG_SAMPLE_RATES))
+handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT))
+handler.addFilter(RedactingFilter())
+log.addHandler(handler)
+
+ch = logging.StreamHandler()
+ch.setFormatter(StructuredFormatter(LOG_FORMAT == 'json'))
+
+listener = logging.handlers.QueueListener(handler.queue, ch, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
+
+def get_logger(category: str) -> logging.Logger:
+    """Логгер для категории записей (обычно — модуля)."""
+    return log.getChild(category)
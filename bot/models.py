@@ -1,6 +1,11 @@
-from typing import List, Optional, Dict, Union
+from typing import List, Optional, Dict, Tuple
 from datetime import datetime, timedelta
-import bot
+from bot import db, events
+from bot.log import get_logger
+from bot.profiling import traced
+from bot.timestamps import utcnow
+
+log = get_logger('models')
 
 ResumeID = str
 """Идентификатор резюме на hh.ru."""
@@ -8,6 +13,9 @@ ResumeID = str
 UserID = int
 """Идентификатор пользователя Telegram."""
 
+ACTIVATION_PERIOD = timedelta(days=7)
+"""На какой срок активируется (и продлевается) продвижение резюме."""
+
 
 class HeadHunterResume:
     """Резюме на hh.ru."""
@@ -36,6 +44,21 @@ class HeadHunterResume:
     until: datetime = None
     """До какого срока активно резюме."""
 
+    is_expiry_warned: bool = False
+    """Предупрежден ли пользователь о скором окончании срока (сбрасывается при активации и продлении)."""
+
+    etag: str = None
+    """Заголовок ETag последнего ответа hh.ru с этим резюме."""
+
+    last_modified: str = None
+    """Заголовок Last-Modified последнего ответа hh.ru с этим резюме."""
+
+    content_hash: str = None
+    """SHA-1 тела последнего ответа hh.ru с этим резюме."""
+
+    is_changed: bool = True
+    """Изменилось ли резюме в hh.ru с прошлого запроса (не хранится; если нет, update() ничего не пишет)."""
+
     def __init__(
             self,
             resume_id: ResumeID,
@@ -45,7 +68,11 @@ class HeadHunterResume:
             access: str,
             user_id: UserID=None,
             is_active: bool=False,
-            until: datetime=None
+            until: datetime=None,
+            is_expiry_warned: bool=False,
+            etag: str=None,
+            last_modified: str=None,
+            content_hash: str=None
     ):
         self.resume_id = resume_id
         self.title = title
@@ -55,6 +82,11 @@ class HeadHunterResume:
         self.user_id = user_id
         self.is_active = is_active
         self.until = until
+        self.is_expiry_warned = is_expiry_warned
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.is_changed = True
 
     def as_dict(self):
         return dict(
@@ -65,14 +97,19 @@ class HeadHunterResume:
             access=self.access,
             user_id=self.user_id,
             is_active=self.is_active,
-            until=self.until
+            until=self.until,
+            is_expiry_warned=self.is_expiry_warned,
+            etag=self.etag,
+            last_modified=self.last_modified,
+            content_hash=self.content_hash
         )
 
     @staticmethod
+    @traced()
     async def create_table() -> None:
-        async with bot.pg_pool.acquire() as conn:
+        async with db.pg_pool.acquire() as conn:
             async with conn.cursor() as cur:
-                bot.log.info("Models: Creating table 'public.resume'...")
+                log.info("Models: Creating table 'public.resume'...")
                 await cur.execute(
                     """
                     CREATE TABLE IF NOT EXISTS public.resume
@@ -85,6 +122,10 @@ class HeadHunterResume:
                         access character varying(64) COLLATE pg_catalog."default" NOT NULL,
                         is_active boolean NOT NULL DEFAULT false,
                         until timestamp with time zone NOT NULL,
+                        is_expiry_warned boolean NOT NULL DEFAULT false,
+                        etag character varying(256) COLLATE pg_catalog."default",
+                        last_modified character varying(64) COLLATE pg_catalog."default",
+                        content_hash character(40) COLLATE pg_catalog."default",
                         CONSTRAINT resume_pkey PRIMARY KEY (resume_id),
                         CONSTRAINT fk_resume_user_id FOREIGN KEY (user_id)
                             REFERENCES public."user" (user_id) MATCH SIMPLE
@@ -98,19 +139,31 @@ class HeadHunterResume:
 
                     ALTER TABLE public.resume
                         OWNER to postgres;
+
+                    -- columns added after the first release
+                    ALTER TABLE public.resume
+                        ADD COLUMN IF NOT EXISTS is_expiry_warned boolean NOT NULL DEFAULT false,
+                        ADD COLUMN IF NOT EXISTS etag character varying(256) COLLATE pg_catalog."default",
+                        ADD COLUMN IF NOT EXISTS last_modified character varying(64) COLLATE pg_catalog."default",
+                        ADD COLUMN IF NOT EXISTS content_hash character(40) COLLATE pg_catalog."default";
+
+                    CREATE INDEX IF NOT EXISTS resume_active_until_idx
+                        ON public.resume (until)
+                        WHERE is_active;
                     """
                 )
 
+    @traced()
     async def create(self) -> None:
-        async with bot.pg_pool.acquire() as conn:
+        async with db.pg_pool.acquire() as conn:
             async with conn.cursor() as cur:
-                bot.log.info(f"Models: Inserting resume {self.resume_id}...")
+                log.debug('Models: Inserting resume...', extra={'resume_id': self.resume_id})
 
                 await cur.execute(
                     """
                     INSERT INTO
                         public.resume
-                        (resume_id, title, status, next_publish_at, access, user_id, is_active, until)
+                        (resume_id, title, status, next_publish_at, access, user_id, is_active, until, is_expiry_warned)
                     VALUES
                         (
                             %(resume_id)s,
@@ -120,17 +173,19 @@ class HeadHunterResume:
                             %(access)s,
                             %(user_id)s,
                             %(is_active)s,
-                            %(until)s
+                            %(until)s,
+                            %(is_expiry_warned)s
                         );
                     """,
                     self.as_dict()
                 )
 
     @staticmethod
+    @traced()
     async def get(resume_id: ResumeID) -> Optional['HeadHunterResume']:
-        async with bot.pg_pool.acquire() as conn:
+        async with db.pg_pool.acquire() as conn:
             async with conn.cursor() as cur:
-                bot.log.info(f'Models: Getting resume with id {resume_id}...')
+                log.debug('Models: Getting resume...', extra={'resume_id': resume_id})
                 await cur.execute(
                     """
                     SELECT
@@ -141,7 +196,10 @@ class HeadHunterResume:
                         next_publish_at,
                         access,
                         is_active,
-                        until
+                        until,
+                        etag,
+                        last_modified,
+                        content_hash
                     FROM
                         public.resume
                     WHERE
@@ -160,35 +218,49 @@ class HeadHunterResume:
                     next_publish_at=resume[4],
                     access=resume[5],
                     is_active=resume[6],
-                    until=resume[7]
+                    until=resume[7],
+                    etag=resume[8],
+                    last_modified=resume[9],
+                    content_hash=resume[10]
                 )
 
+    @traced()
     async def update(self) -> None:
-        async with bot.pg_pool.acquire() as conn:
+        """Сохраняет полученные из hh.ru поля резюме.
+
+        Поля, которыми управляет бот (user_id, is_active, until), не пишутся: объект мог быть
+        загружен задолго до вызова, и за это время пользователь мог деактивировать или продлить резюме.
+        """
+        if not self.is_changed:
+            log.debug('Models: Resume is unchanged, skipping update', extra={'resume_id': self.resume_id})
+            return
+
+        async with db.pg_pool.acquire() as conn:
             async with conn.cursor() as cur:
-                bot.log.info(f'Models: Updating resume with id {self.resume_id}...')
+                log.debug('Models: Updating resume...', extra={'resume_id': self.resume_id})
                 await cur.execute(
                     """
                     UPDATE
                         public.resume
                     SET
-                        user_id=%(user_id)s,
                         title=%(title)s,
                         status=%(status)s,
                         next_publish_at=%(next_publish_at)s,
                         access=%(access)s,
-                        is_active=%(is_active)s,
-                        until=%(until)s
+                        etag=%(etag)s,
+                        last_modified=%(last_modified)s,
+                        content_hash=%(content_hash)s
                     WHERE
                         resume_id = %(resume_id)s;
                     """,
                     self.as_dict()
                 )
 
+    @traced()
     async def upsert(self) -> None:
-        async with bot.pg_pool.acquire() as conn:
+        async with db.pg_pool.acquire() as conn:
             async with conn.cursor() as cur:
-                bot.log.info(f'Models: Inserting or updating resume with id {self.resume_id}...')
+                log.debug('Models: Inserting or updating resume...', extra={'resume_id': self.resume_id})
                 await cur.execute(
                     """
                     UPDATE
@@ -200,12 +272,13 @@ class HeadHunterResume:
                         next_publish_at=%(next_publish_at)s,
                         access=%(access)s,
                         is_active=%(is_active)s,
-                        until=%(until)s
+                        until=%(until)s,
+                        is_expiry_warned=%(is_expiry_warned)s
                     WHERE resume_id=%(resume_id)s;
                     
                     INSERT INTO
                         public.resume
-                        (resume_id, title, status, next_publish_at, access, user_id, is_active, until)
+                        (resume_id, title, status, next_publish_at, access, user_id, is_active, until, is_expiry_warned)
                         SELECT
                             %(resume_id)s,
                             %(title)s,
@@ -214,7 +287,8 @@ class HeadHunterResume:
                             %(access)s,
                             %(user_id)s,
                             %(is_active)s,
-                            %(until)s
+                            %(until)s,
+                            %(is_expiry_warned)s
                         WHERE NOT EXISTS (
                             SELECT
                                 1
@@ -227,22 +301,244 @@ class HeadHunterResume:
                     self.as_dict()
                 )
 
+    @traced()
     async def activate(self) -> None:
-        bot.log.info(f'Models: Activating resume with id {self.resume_id}...')
-        self.is_active = True
-        self.until = datetime.now() + timedelta(days=7)
-        await self.upsert()
+        await HeadHunterResume.activate_many([self])
+
+    @staticmethod
+    @traced()
+    async def activate_many(resumes: List['HeadHunterResume']) -> None:
+        """Активирует резюме одним запросом (вставляя новые и обновляя существующие) и уведомляет о них toucher."""
+        # a row cannot be upserted twice by one statement
+        resumes = list({r.resume_id: r for r in resumes}.values())
+        if not resumes:
+            return
+
+        until = utcnow() + ACTIVATION_PERIOD
+        for resume in resumes:
+            resume.is_active = True
+            resume.until = until
+            resume.is_expiry_warned = False
+
+        async with db.pg_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                log.debug('Models: Activating resumes...', extra={'resume_ids': [r.resume_id for r in resumes]})
+
+                row = '(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'
+                params = []
+                for r in resumes:
+                    params.extend((r.resume_id, r.title, r.status, r.next_publish_at, r.access, r.user_id,
+                                   r.is_active, r.until, r.is_expiry_warned, r.etag, r.last_modified, r.content_hash))
 
+                await cur.execute(
+                    """
+                    INSERT INTO
+                        public.resume
+                        (resume_id, title, status, next_publish_at, access, user_id, is_active, until, is_expiry_warned,
+                         etag, last_modified, content_hash)
+                    VALUES
+                        """ + ', '.join([row] * len(resumes)) + """
+                    ON CONFLICT (resume_id) DO UPDATE SET
+                        user_id=EXCLUDED.user_id,
+                        title=EXCLUDED.title,
+                        status=EXCLUDED.status,
+                        next_publish_at=EXCLUDED.next_publish_at,
+                        access=EXCLUDED.access,
+                        is_active=EXCLUDED.is_active,
+                        until=EXCLUDED.until,
+                        is_expiry_warned=EXCLUDED.is_expiry_warned,
+                        etag=EXCLUDED.etag,
+                        last_modified=EXCLUDED.last_modified,
+                        content_hash=EXCLUDED.content_hash;
+                    """,
+                    params
+                )
+
+        await events.notify_many(events.RESUME_ACTIVATED_CHANNEL, [r.resume_id for r in resumes])
+
+    @traced()
     async def deactivate(self) -> None:
-        bot.log.info(f'Models: Deactivating resume with id {self.resume_id}...')
         self.is_active = False
-        await self.update()
+
+        async with db.pg_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                log.debug('Models: Deactivating resume...', extra={'resume_id': self.resume_id})
+                await cur.execute(
+                    """
+                    UPDATE
+                        public.resume
+                    SET
+                        is_active=false
+                    WHERE
+                        resume_id = %(resume_id)s;
+                    """,
+                    {'resume_id': self.resume_id}
+                )
 
     @staticmethod
+    @traced()
+    async def extend_user_resume_list(user: 'TelegramUser') -> List['HeadHunterResume']:
+        """Продлевает продвижение всех активных резюме пользователя на ACTIVATION_PERIOD от текущего момента.
+
+        :return: продленные резюме (только идентификатор, название и новый срок)
+        """
+        assert user.user_id
+
+        async with db.pg_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                log.debug('Models: Extending resumes...', extra={'user_id': user.user_id})
+                await cur.execute(
+                    """
+                    UPDATE
+                        public.resume
+                    SET
+                        until=%(until)s,
+                        is_expiry_warned=false
+                    WHERE
+                        user_id=%(user_id)s AND
+                        is_active
+                    RETURNING
+                        resume_id,
+                        title,
+                        until;
+                    """,
+                    {
+                        'user_id': user.user_id,
+                        'until': utcnow() + ACTIVATION_PERIOD
+                    }
+                )
+
+                return [
+                    HeadHunterResume(
+                        resume_id=r[0],
+                        title=r[1],
+                        status=None,
+                        next_publish_at=None,
+                        access=None,
+                        user_id=user.user_id,
+                        is_active=True,
+                        until=r[2]
+                    )
+                    for r in await cur.fetchall()
+                ]
+
+    @staticmethod
+    @traced()
+    async def get_expiring_resume_list(deadline: datetime) -> List['HeadHunterResume']:
+        """Возвращает активные резюме, срок которых истекает до deadline и о которых пользователь еще не предупрежден.
+
+        После отправки предупреждения резюме нужно отметить вызовом mark_expiry_warned().
+
+        :return: резюме (только идентификатор, пользователь, название и срок)
+        """
+        async with db.pg_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                log.debug('Models: Getting expiring resumes...')
+                await cur.execute(
+                    """
+                    SELECT
+                        resume_id,
+                        user_id,
+                        title,
+                        until
+                    FROM
+                        public.resume
+                    WHERE
+                        is_active AND
+                        until < %(deadline)s AND
+                        until >= now() AND
+                        NOT is_expiry_warned;
+                    """,
+                    {'deadline': deadline}
+                )
+
+                return [
+                    HeadHunterResume(
+                        resume_id=r[0],
+                        title=r[2],
+                        status=None,
+                        next_publish_at=None,
+                        access=None,
+                        user_id=r[1],
+                        is_active=True,
+                        until=r[3]
+                    )
+                    for r in await cur.fetchall()
+                ]
+
+    @staticmethod
+    @traced()
+    async def mark_expiry_warned(resume_ids: List[ResumeID], deadline: datetime) -> None:
+        """Отмечает резюме предупрежденными, если их срок всё еще истекает до deadline.
+
+        Резюме, продленные после выборки get_expiring_resume_list(), не отмечаются.
+        """
+        if not resume_ids:
+            return
+
+        async with db.pg_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                log.debug('Models: Marking resumes as warned about expiry...', extra={'count': len(resume_ids)})
+                await cur.execute(
+                    """
+                    UPDATE
+                        public.resume
+                    SET
+                        is_expiry_warned=true
+                    WHERE
+                        resume_id = ANY(%(resume_ids)s) AND
+                        until < %(deadline)s;
+                    """,
+                    {'resume_ids': resume_ids, 'deadline': deadline}
+                )
+
+    @staticmethod
+    @traced()
+    async def take_timed_out_resume_list() -> List['HeadHunterResume']:
+        """Деактивирует и возвращает активные резюме, срок продвижения которых истек.
+
+        :return: резюме (только идентификатор, пользователь, название и срок)
+        """
+        async with db.pg_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                log.debug('Models: Taking timed out resumes...')
+                await cur.execute(
+                    """
+                    UPDATE
+                        public.resume
+                    SET
+                        is_active=false
+                    WHERE
+                        is_active AND
+                        until < now()
+                    RETURNING
+                        resume_id,
+                        user_id,
+                        title,
+                        until;
+                    """
+                )
+
+                return [
+                    HeadHunterResume(
+                        resume_id=r[0],
+                        title=r[2],
+                        status=None,
+                        next_publish_at=None,
+                        access=None,
+                        user_id=r[1],
+                        is_active=False,
+                        until=r[3]
+                    )
+                    for r in await cur.fetchall()
+                ]
+
+    @staticmethod
+    @traced()
     async def get_user_active_resume_list(user: 'TelegramUser') -> List['HeadHunterResume']:
         assert user.user_id
 
-        async with bot.pg_pool.acquire() as conn:
+        async with db.pg_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 await cur.execute(
                     """
@@ -282,10 +578,20 @@ class HeadHunterResume:
                 ]
 
     @staticmethod
-    async def get_active_resume_list() -> Dict[UserID, List[Dict[str, Union['HeadHunterResume', 'TelegramUser']]]]:
-        async with bot.pg_pool.acquire() as conn:
+    @traced()
+    async def get_active_resume_list(
+            resume_id: ResumeID=None,
+            due_before: datetime=None
+    ) -> List[Tuple['TelegramUser', List['HeadHunterResume']]]:
+        """Возвращает активные резюме, сгруппированные по пользователям.
+
+        :param resume_id: вернуть только резюме с этим идентификатором
+        :param due_before: вернуть только резюме, которые можно поднять раньше этого времени
+        :return: список пар (пользователь с токеном, его активные резюме)
+        """
+        async with db.pg_pool.acquire() as conn:
             async with conn.cursor() as cur:
-                bot.log.info(f'Models: Getting active resume list...')
+                log.debug('Models: Getting active resume list...', extra={'resume_id': resume_id})
                 await cur.execute(
                     """
                     SELECT
@@ -295,42 +601,57 @@ class HeadHunterResume:
                         public.resume.next_publish_at,  -- 3
                         public.resume.access,     -- 4
                         public.resume.until,      -- 5
-                        public.user.user_id       -- 6
-                        public.user.hh_token      -- 7
+                        public.user.user_id,      -- 6
+                        public.user.hh_token,     -- 7
+                        public.user.token_checked_at,  -- 8
+                        public.resume.etag,       -- 9
+                        public.resume.last_modified,  -- 10
+                        public.resume.content_hash  -- 11
                     FROM
                         public.resume
                     JOIN
                         public.user ON public.user.user_id = public.resume.user_id
                     WHERE
-                        active;
-                    """
+                        public.resume.is_active AND
+                        public.resume.until >= now() AND
+                        public.user.is_token_valid AND
+                        (%(resume_id)s IS NULL OR public.resume.resume_id = %(resume_id)s) AND
+                        (%(due_before)s IS NULL OR public.resume.next_publish_at < %(due_before)s)
+                    ORDER BY
+                        public.user.user_id;
+                    """,
+                    {'resume_id': resume_id, 'due_before': due_before}
                 )
 
-                resumes_and_users = {}
+                users_and_resumes: Dict[UserID, Tuple[TelegramUser, List[HeadHunterResume]]] = {}
 
                 for r in await cur.fetchall():
                     user_id = r[6]
-                    if user_id not in resumes_and_users:
-                        resumes_and_users[user_id] = []
-
-                    resumes_and_users[user_id].append(
-                        {
-                            'resume': HeadHunterResume(
-                                resume_id=r[0],
-                                title=r[1],
-                                status=r[2],
-                                next_publish_at=r[3],
-                                access=r[4],
-                                until=r[5]
-                            ),
-                            'user': TelegramUser(
-                                user_id=user_id,
-                                hh_token=r[7]
-                            )
-                        }
+                    if user_id not in users_and_resumes:
+                        user = TelegramUser(
+                            user_id=user_id,
+                            hh_token=r[7],
+                            token_checked_at=r[8]
+                        )
+                        users_and_resumes[user_id] = (user, [])
+
+                    users_and_resumes[user_id][1].append(
+                        HeadHunterResume(
+                            resume_id=r[0],
+                            title=r[1],
+                            status=r[2],
+                            next_publish_at=r[3],
+                            access=r[4],
+                            user_id=user_id,
+                            is_active=True,
+                            until=r[5],
+                            etag=r[9],
+                            last_modified=r[10],
+                            content_hash=r[11]
+                        )
                     )
 
-                return resumes_and_users
+                return list(users_and_resumes.values())
 
 
 class TelegramUser:
@@ -354,6 +675,12 @@ class TelegramUser:
     is_waiting_for_token: bool = True
     """Состояние: ожидается ли от пользователя токен в следующем сообщении."""
 
+    is_token_valid: bool = True
+    """Действителен ли токен (False, если hh.ru отклонил его при проверке)."""
+
+    token_checked_at: datetime = None
+    """Когда токен в последний раз успешно прошел проверку в API hh.ru."""
+
     def __init__(
             self,
             user_id: UserID,
@@ -361,7 +688,9 @@ class TelegramUser:
             first_name: str=None,
             last_name: str=None,
             email: str=None,
-            is_waiting_for_token: bool=True
+            is_waiting_for_token: bool=True,
+            is_token_valid: bool=True,
+            token_checked_at: datetime=None
     ):
         self.user_id = user_id
         self.hh_token = hh_token
@@ -369,6 +698,8 @@ class TelegramUser:
         self.last_name = last_name
         self.email = email
         self.is_waiting_for_token = is_waiting_for_token
+        self.is_token_valid = is_token_valid
+        self.token_checked_at = token_checked_at
 
     def as_dict(self):
         return dict(
@@ -377,15 +708,18 @@ class TelegramUser:
             first_name=self.first_name,
             last_name=self.last_name,
             email=self.email,
-            is_waiting_for_token=self.is_waiting_for_token
+            is_waiting_for_token=self.is_waiting_for_token,
+            is_token_valid=self.is_token_valid,
+            token_checked_at=self.token_checked_at
         )
 
     @staticmethod
+    @traced()
     async def create_table() -> None:
         """Метод для создания таблицы в БД."""
-        async with bot.pg_pool.acquire() as conn:
+        async with db.pg_pool.acquire() as conn:
             async with conn.cursor() as cur:
-                bot.log.info("Models: Creating table 'public.user'...")
+                log.info("Models: Creating table 'public.user'...")
                 await cur.execute(
                     """
                     CREATE TABLE IF NOT EXISTS public."user"
@@ -396,6 +730,8 @@ class TelegramUser:
                         last_name character varying(64) COLLATE pg_catalog."default",
                         email character varying(64) COLLATE pg_catalog."default",
                         is_waiting_for_token boolean NOT NULL DEFAULT true,
+                        is_token_valid boolean NOT NULL DEFAULT true,
+                        token_checked_at timestamp with time zone,
                         CONSTRAINT user_pkey PRIMARY KEY (user_id)
                     )
                     WITH (
@@ -405,18 +741,25 @@ class TelegramUser:
 
                     ALTER TABLE public."user"
                         OWNER to postgres;
+
+                    -- columns added after the first release
+                    ALTER TABLE public."user"
+                        ADD COLUMN IF NOT EXISTS is_token_valid boolean NOT NULL DEFAULT true,
+                        ADD COLUMN IF NOT EXISTS token_checked_at timestamp with time zone;
                     """
                 )
 
+    @traced()
     async def create(self) -> None:
-        async with bot.pg_pool.acquire() as conn:
+        async with db.pg_pool.acquire() as conn:
             async with conn.cursor() as cur:
-                bot.log.info(f'Models: Creating user with id {self.user_id}...')
+                log.debug('Models: Creating user...', extra={'user_id': self.user_id})
                 await cur.execute(
                     """
                     INSERT INTO
                         public.user
-                        (user_id, hh_token, first_name, last_name, email, is_waiting_for_token)
+                        (user_id, hh_token, first_name, last_name, email, is_waiting_for_token, is_token_valid,
+                         token_checked_at)
                     VALUES
                     (
                         %(user_id)s,
@@ -424,17 +767,20 @@ class TelegramUser:
                         %(first_name)s,
                         %(last_name)s,
                         %(email)s,
-                        %(is_waiting_for_token)s
+                        %(is_waiting_for_token)s,
+                        %(is_token_valid)s,
+                        %(token_checked_at)s
                     );
                     """,
                     self.as_dict()
                 )
 
     @staticmethod
+    @traced()
     async def get(user_id: UserID) -> Optional['TelegramUser']:
-        async with bot.pg_pool.acquire() as conn:
+        async with db.pg_pool.acquire() as conn:
             async with conn.cursor() as cur:
-                bot.log.info(f'Models: Getting user with id {user_id}...')
+                log.debug('Models: Getting user...', extra={'user_id': user_id})
                 await cur.execute(
                     """
                     SELECT
@@ -443,7 +789,9 @@ class TelegramUser:
                         first_name,
                         last_name,
                         email,
-                        is_waiting_for_token
+                        is_waiting_for_token,
+                        is_token_valid,
+                        token_checked_at
                     FROM
                         public.user
                     WHERE
@@ -460,13 +808,16 @@ class TelegramUser:
                     first_name=user[2],
                     last_name=user[3],
                     email=user[4],
-                    is_waiting_for_token=user[5]
+                    is_waiting_for_token=user[5],
+                    is_token_valid=user[6],
+                    token_checked_at=user[7]
                 )
 
+    @traced()
     async def update(self) -> None:
-        async with bot.pg_pool.acquire() as conn:
+        async with db.pg_pool.acquire() as conn:
             async with conn.cursor() as cur:
-                bot.log.info(f"Models: Updating user with id {self.user_id}...")
+                log.debug('Models: Updating user...', extra={'user_id': self.user_id})
 
                 await cur.execute(
                     """
@@ -477,9 +828,161 @@ class TelegramUser:
                         first_name=%(first_name)s,
                         last_name=%(last_name)s,
                         email=%(email)s,
-                        is_waiting_for_token=%(is_waiting_for_token)s
+                        is_waiting_for_token=%(is_waiting_for_token)s,
+                        is_token_valid=%(is_token_valid)s,
+                        token_checked_at=%(token_checked_at)s
                     WHERE
                         user_id=%(user_id)s;
                     """,
                     self.as_dict()
                 )
+
+    @staticmethod
+    @traced()
+    async def update_waiting_for_token(states: Dict[UserID, bool]) -> None:
+        """Записывает состояние is_waiting_for_token сразу для многих пользователей.
+
+        Строки, в которых значение не изменилось, не перезаписываются.
+
+        :param states: новые значения по идентификаторам пользователей
+        """
+        async with db.pg_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                log.debug('Models: Updating conversation states...', extra={'count': len(states)})
+                await cur.execute(
+                    """
+                    UPDATE
+                        public.user
+                    SET
+                        is_waiting_for_token=s.is_waiting_for_token
+                    FROM
+                        unnest(%(user_ids)s::bigint[], %(states)s::boolean[]) AS s(user_id, is_waiting_for_token)
+                    WHERE
+                        public.user.user_id = s.user_id AND
+                        public.user.is_waiting_for_token <> s.is_waiting_for_token;
+                    """,
+                    {
+                        'user_ids': list(states.keys()),
+                        'states': list(states.values())
+                    }
+                )
+
+    @staticmethod
+    @traced()
+    async def get_users_for_token_check(checked_before: datetime, limit: int) -> List['TelegramUser']:
+        """Возвращает пользователей с действительными токенами, которые давно не проверялись.
+
+        :param checked_before: проверять токены, последняя проверка которых была раньше этого времени
+        :param limit: максимальное количество пользователей
+        :return: пользователи, начиная с тех, чьи токены проверялись раньше всех
+        """
+        async with db.pg_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                log.debug('Models: Getting users for token check...')
+                await cur.execute(
+                    """
+                    SELECT
+                        user_id,
+                        hh_token,
+                        token_checked_at
+                    FROM
+                        public.user
+                    WHERE
+                        hh_token IS NOT NULL AND
+                        is_token_valid AND
+                        (token_checked_at IS NULL OR token_checked_at < %(checked_before)s)
+                    ORDER BY
+                        token_checked_at NULLS FIRST
+                    LIMIT %(limit)s;
+                    """,
+                    {
+                        'checked_before': checked_before,
+                        'limit': limit
+                    }
+                )
+
+                return [
+                    TelegramUser(
+                        user_id=u[0],
+                        hh_token=u[1],
+                        token_checked_at=u[2]
+                    )
+                    for u in await cur.fetchall()
+                ]
+
+    @staticmethod
+    @traced()
+    async def mark_tokens_checked(user_ids: List[UserID]) -> None:
+        """Отмечает токены пользователей как успешно проверенные сейчас."""
+        if not user_ids:
+            return
+
+        async with db.pg_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                log.debug('Models: Marking tokens as checked...', extra={'count': len(user_ids)})
+                await cur.execute(
+                    """
+                    UPDATE
+                        public.user
+                    SET
+                        token_checked_at=now()
+                    WHERE
+                        user_id = ANY(%(user_ids)s);
+                    """,
+                    {'user_ids': user_ids}
+                )
+
+    @staticmethod
+    @traced()
+    async def invalidate_tokens(tokens: Dict[UserID, str]) -> List[UserID]:
+        """Помечает токены недействительными и деактивирует все резюме их владельцев.
+
+        Токен помечается, только если у пользователя всё ещё тот же токен и он ещё не помечен,
+        поэтому каждый пользователь попадает в результат не более одного раза.
+
+        :param tokens: недействительные токены по идентификаторам пользователей
+        :return: идентификаторы пользователей, токены которых были помечены этим вызовом
+        """
+        if not tokens:
+            return []
+
+        async with db.pg_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                log.debug('Models: Invalidating tokens...', extra={'count': len(tokens)})
+                await cur.execute(
+                    """
+                    WITH invalidated AS (
+                        UPDATE
+                            public.user
+                        SET
+                            is_token_valid=false,
+                            is_waiting_for_token=true
+                        FROM
+                            unnest(%(user_ids)s::bigint[], %(tokens)s::varchar[]) AS t(user_id, hh_token)
+                        WHERE
+                            public.user.user_id = t.user_id AND
+                            public.user.hh_token = t.hh_token AND
+                            public.user.is_token_valid
+                        RETURNING
+                            public.user.user_id
+                    ), deactivated AS (
+                        UPDATE
+                            public.resume
+                        SET
+                            is_active=false
+                        WHERE
+                            is_active AND
+                            user_id IN (SELECT user_id FROM invalidated)
+                    )
+                    SELECT
+                        user_id
+                    FROM
+                        invalidated;
+                    """,
+                    {
+                        'user_ids': list(tokens.keys()),
+                        'tokens': list(tokens.values())
+                    }
+                )
+
+                return [u[0] for u in await cur.fetchall()]
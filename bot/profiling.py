@@ -0,0 +1,226 @@
+"""Опциональное профилирование: время, проведенное в запросах к hh.ru, БД и Telegram.
+
+Включается переменной окружения PROFILE_MODE:
+* off (по умолчанию) — декоратор traced() возвращает функцию без изменений, накладных расходов нет;
+* full — замеряется каждый вызов;
+* sample — замеряется доля PROFILE_SAMPLE_RATE деревьев вызовов (решение принимается
+  на верхнем уровне каждой задачи asyncio и наследуется вложенными вызовами).
+
+Замеры агрегируются по стекам вызовов и сбрасываются в файлы
+вызовом dump(): JSON и/или folded stacks (формат flamegraph.pl и speedscope).
+Задачи asyncio, созданные внутри замеряемого вызова (ensure_future, gather), наследуют стек
+и решение о выборке родительской задачи, поэтому их вызовы попадают в стек родителя.
+"""
+from typing import Dict, List, Optional
+from collections import defaultdict
+from contextlib import contextmanager
+import asyncio
+import functools
+import json
+import os
+import random
+import time
+import weakref
+from bot.log import get_logger
+from bot.timestamps import utcnow
+
+log = get_logger('profiling')
+
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'off')
+"""Режим профилирования: off, full или sample."""
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.01))
+"""Доля замеряемых деревьев вызовов в режиме sample."""
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '.')
+"""Каталог для файлов с результатами."""
+
+PROFILE_FORMATS = os.environ.get('PROFILE_FORMATS', 'json,folded').split(',')
+"""Форматы файлов с результатами: json, folded."""
+
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 0))
+"""Вызовы дольше этого времени пишутся в лог; 0 — не писать."""
+
+PROFILE_DUMP_INTERVAL = int(os.environ.get('PROFILE_DUMP_INTERVAL_SECONDS', 15 * 60))
+"""Как часто сбрасывать результаты в процессах без циклов (бот), в секундах."""
+
+ENABLED = PROFILE_MODE in ('full', 'sample')
+
+_current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+
+_NOT_SAMPLED: List[str] = []
+"""Стек задачи, дерево вызовов которой не попало в выборку."""
+
+_stacks: 'weakref.WeakKeyDictionary[asyncio.Task, List[str]]' = weakref.WeakKeyDictionary()
+
+
+class Profile:
+    """Агрегированные замеры: стек вызовов -> количество и суммарное время."""
+
+    def __init__(self):
+        self.started = utcnow()
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.totals: Dict[str, float] = defaultdict(float)
+
+    def add(self, stack: str, elapsed: float) -> None:
+        self.counts[stack] += 1
+        self.totals[stack] += elapsed
+
+    def self_times(self) -> Dict[str, float]:
+        """Время, проведенное в каждом стеке за вычетом вложенных вызовов.
+
+        Вложенные вызовы из параллельных задач могут в сумме занять больше времени, чем родитель;
+        тогда собственное время родителя считается нулевым.
+        """
+        result = dict(self.totals)
+        for stack, total in self.totals.items():
+            parent, sep, _ = stack.rpartition(';')
+            if sep and parent in result:
+                result[parent] -= total
+        return {stack: max(0.0, elapsed) for stack, elapsed in result.items()}
+
+    def as_dict(self, name: str) -> dict:
+        self_times = self.self_times()
+        return {
+            'name': name,
+            'started': self.started.isoformat(),
+            'finished': utcnow().isoformat(),
+            'mode': PROFILE_MODE,
+            'sample_rate': PROFILE_SAMPLE_RATE if PROFILE_MODE == 'sample' else 1.0,
+            'spans': [
+                {
+                    'stack': stack,
+                    'count': self.counts[stack],
+                    'total_ms': round(total * 1000, 3),
+                    'self_ms': round(self_times[stack] * 1000, 3),
+                }
+                for stack, total in sorted(self.totals.items(), key=lambda s: s[1], reverse=True)
+            ],
+        }
+
+    def as_folded(self) -> str:
+        return ''.join(
+            f'{stack} {int(elapsed * 1e6)}\n'
+            for stack, elapsed in sorted(self.self_times().items())
+        )
+
+
+_profile = Profile()
+
+
+def _task_factory(loop: asyncio.AbstractEventLoop, coro) -> asyncio.Task:
+    """Фабрика задач, передающая новой задаче копию стека вызовов текущей задачи."""
+    task = _parent_task_factory(loop, coro) if _parent_task_factory else asyncio.Task(coro, loop=loop)
+
+    try:
+        parent = _current_task(loop=loop)
+    except RuntimeError:
+        # no running loop: the task is created before the loop has started
+        parent = None
+
+    stack = _stacks.get(parent) if parent is not None else None
+    if stack is not None:
+        _stacks[task] = stack if stack is _NOT_SAMPLED else list(stack)
+
+    return task
+
+
+_parent_task_factory = None
+
+if ENABLED:
+    _loop = asyncio.get_event_loop()
+    _parent_task_factory = _loop.get_task_factory()
+    _loop.set_task_factory(_task_factory)
+
+
+@contextmanager
+def span(name: str):
+    """Замеряет время выполнения блока внутри текущей задачи asyncio."""
+    task = _current_task() if ENABLED else None
+    if task is None:
+        yield
+        return
+
+    stack: Optional[List[str]] = _stacks.get(task)
+    is_root = stack is None
+
+    if is_root:
+        if PROFILE_MODE == 'sample' and random.random() >= PROFILE_SAMPLE_RATE:
+            _stacks[task] = _NOT_SAMPLED
+            try:
+                yield
+            finally:
+                del _stacks[task]
+            return
+        stack = _stacks[task] = []
+    elif stack is _NOT_SAMPLED:
+        yield
+        return
+
+    stack.append(name)
+    path = ';'.join(stack)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stack.pop()
+        if is_root:
+            del _stacks[task]
+
+        _profile.add(path, elapsed)
+        if PROFILE_SLOW_MS and elapsed * 1000 >= PROFILE_SLOW_MS:
+            log.warning(f'Slow call: {path} took {elapsed * 1000:.0f} ms')
+
+
+def traced(name: str=None):
+    """Декоратор для корутин: замеряет каждый вызов как span.
+
+    Если профилирование выключено, возвращает функцию без изменений.
+
+    :param name: имя в стеке вызовов; по умолчанию — модуль и имя функции
+    """
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        span_name = name or f'{fn.__module__}.{fn.__qualname__}'
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(span_name):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def dump(name: str) -> None:
+    """Записывает накопленные замеры в файлы PROFILE_DIR и начинает накопление заново."""
+    global _profile
+
+    if not ENABLED:
+        return
+
+    profile, _profile = _profile, Profile()
+    if not profile.totals:
+        return
+
+    path = os.path.join(PROFILE_DIR, f'{name}-{profile.started:%Y%m%dT%H%M%S}')
+
+    if 'json' in PROFILE_FORMATS:
+        with open(f'{path}.json', 'w') as f:
+            json.dump(profile.as_dict(name), f, ensure_ascii=False, indent=2)
+    if 'folded' in PROFILE_FORMATS:
+        with open(f'{path}.folded', 'w') as f:
+            f.write(profile.as_folded())
+
+    log.info(f'Profile written: {path}')
+
+
+async def dump_periodically(name: str) -> None:
+    """Сбрасывает замеры каждые PROFILE_DUMP_INTERVAL секунд (для процессов без циклов)."""
+    while ENABLED:
+        await asyncio.sleep(PROFILE_DUMP_INTERVAL)
+        dump(name)
@@ -0,0 +1,240 @@
+"""Запись и воспроизведение потока сообщений Telegram для нагрузочного тестирования.
+
+Запись включается в боте переменной окружения RECORD_UPDATES=<путь к файлу>: каждое входящее
+сообщение дописывается в JSONL-файл в сокращенном виде (без имен пользователей, токены hh.ru
+заменены на фиктивный токен).
+
+Воспроизведение прогоняет записанные сообщения через bot.chat.on_chat_message с исходными
+интервалами, ускоренными в --speed раз. hh.ru и Telegram заменяются фиктивными реализациями,
+а PostgreSQL используется настоящий, но обязательно в отдельной базе --database на том же сервере
+(остальные переменные окружения те же, что у бота). В базе бота воспроизведение затерло бы токены
+настоящих пользователей и разослало бы события активации работающему toucher, поэтому с базой
+из POSTGRES_DB оно не запускается. Перед воспроизведением каждый встречающийся в записи пользователь
+заводится в этой базе с токеном REPLAY_TOKEN, чтобы команды hh.ru доходили до фиктивного API.
+В конце выводится распределение времени обработки по командам и количество ошибок.
+
+Использование:
+    python -m bot.replay updates.jsonl --database DB [--speed N] [--hh-latency MS] [--tg-latency MS]
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import math
+import os
+import re
+from datetime import timedelta
+import bot.models
+from bot.log import get_logger
+from bot.timestamps import utcnow
+
+log = get_logger('replay')
+
+REPLAY_TOKEN = 'X' * 64
+"""Токен, которым заменяются токены hh.ru при записи; проходит проверку формата в боте."""
+
+_token_pattern = re.compile(r'\b[A-Za-z0-9]{64}\b')
+
+
+def compact_message(msg: dict) -> dict:
+    """Оставляет в сообщении только то, что нужно обработчику, и заменяет токены."""
+    compact = {k: v for k, v in msg.items() if k not in ('from', 'chat', 'text', 'entities')}
+    compact = {k: None if isinstance(v, (dict, list)) else v for k, v in compact.items()}
+    compact['chat'] = {'id': msg['chat']['id'], 'type': msg['chat']['type']}
+    if 'from' in msg:
+        compact['from'] = {'id': msg['from']['id']}
+    if 'text' in msg:
+        compact['text'] = _token_pattern.sub(REPLAY_TOKEN, msg['text'])
+    return compact
+
+
+def record_updates(handler, path: str):
+    """Оборачивает обработчик сообщений так, чтобы каждое сообщение записывалось в файл."""
+    loop = asyncio.get_event_loop()
+    started = loop.time()
+    f = open(path, 'a', buffering=1)
+
+    @functools.wraps(handler)
+    async def wrapper(msg):
+        record = {'t': round(loop.time() - started, 3), 'message': compact_message(msg)}
+        f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        return await handler(msg)
+
+    log.info(f'Recording updates to {path}')
+    return wrapper
+
+
+def command_of(msg: dict) -> str:
+    """Категория сообщения для статистики: команда без идентификаторов, 'text' или тип содержимого."""
+    text = msg.get('text')
+    if text is None:
+        return 'non-text'
+    command = text.split()[0].lower() if text.split() else ''
+    if not command.startswith('/'):
+        return 'text'
+    return re.sub(r'_.*$', '_<id>', command)
+
+
+class FakeHeadHunterAPI:
+    """Фиктивный API hh.ru: у каждого токена три резюме, каждый запрос занимает latency секунд."""
+
+    latency: float = 0.05
+
+    first_name = 'Replay'
+    last_name = 'User'
+    email = 'replay@example.com'
+
+    def __init__(self, api_token: str):
+        self.api_token = api_token
+        self.prefix = hashlib.sha1(api_token.encode()).hexdigest()[:8]
+
+    @classmethod
+    async def create(cls, api_token: str, check_token: bool=True) -> 'FakeHeadHunterAPI':
+        api = cls(api_token)
+        if check_token:
+            await asyncio.sleep(cls.latency)
+        return api
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):
+        pass
+
+    async def get_resume(self, resume_id: str, cached: bot.models.HeadHunterResume=None) -> bot.models.HeadHunterResume:
+        await asyncio.sleep(self.latency)
+        return bot.models.HeadHunterResume(
+            resume_id=resume_id,
+            title=f'Replay resume {resume_id}',
+            status='published',
+            access='everyone',
+            next_publish_at=utcnow() + timedelta(hours=4)
+        )
+
+    async def get_resumes(self, resume_ids: List[str]) -> List[bot.models.HeadHunterResume]:
+        return list(await asyncio.gather(*(self.get_resume(resume_id) for resume_id in resume_ids)))
+
+    async def get_resume_list(self) -> List[bot.models.HeadHunterResume]:
+        await asyncio.sleep(self.latency)
+        return await self.get_resumes([f'{self.prefix}{i}' for i in range(3)])
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def print_report(latencies: Dict[str, List[float]], errors: Dict[str, int], elapsed: float) -> None:
+    """Выводит распределение времени обработки успешно обработанных сообщений и количество ошибок по командам."""
+    total = sum(len(v) for v in latencies.values()) + sum(errors.values())
+    print(f'{total} messages in {elapsed:.1f} s ({total / max(elapsed, 1e-9):.1f} msg/s), '
+          f'{sum(errors.values())} errors')
+    print(f'{"command":24} {"count":>7} {"errors":>7} {"p50 ms":>9} {"p90 ms":>9} {"p99 ms":>9} {"max ms":>9}')
+    commands = set(latencies) | set(errors)
+    for command in sorted(commands, key=lambda c: len(latencies.get(c, [])) + errors.get(c, 0), reverse=True):
+        values = latencies.get(command, [])
+        line = f'{command:24} {len(values):7} {errors.get(command, 0):7} '
+        if values:
+            line += (f'{percentile(values, 50) * 1000:9.1f} {percentile(values, 90) * 1000:9.1f} '
+                     f'{percentile(values, 99) * 1000:9.1f} {max(values) * 1000:9.1f}')
+        print(line)
+
+
+async def seed_users(records: List[dict]) -> None:
+    """Заводит пользователей из записи с токеном REPLAY_TOKEN, не ожидающих ввода токена."""
+    user_ids = {
+        int(record['message']['chat']['id'])
+        for record in records
+        if record['message']['chat']['type'] == 'private'
+    }
+
+    for user_id in user_ids:
+        user = await bot.models.TelegramUser.get(user_id)
+        is_new = user is None
+        if is_new:
+            user = bot.models.TelegramUser(user_id=user_id)
+
+        user.hh_token = REPLAY_TOKEN
+        user.first_name = FakeHeadHunterAPI.first_name
+        user.last_name = FakeHeadHunterAPI.last_name
+        user.email = FakeHeadHunterAPI.email
+        user.is_waiting_for_token = False
+        user.is_token_valid = True
+        user.token_checked_at = utcnow()
+
+        if is_new:
+            await user.create()
+        else:
+            await user.update()
+
+    log.info('Seeded users', extra={'count': len(user_ids)})
+
+
+async def replay(path: str, database: str, speed: float, hh_latency: float, tg_latency: float) -> None:
+    if database == os.environ.get('POSTGRES_DB'):
+        raise SystemExit(f'Refusing to replay into the bot database {database!r}: pass a separate --database')
+    os.environ['POSTGRES_DB'] = database
+
+    import bot.chat
+    from bot.db import postgres_connect, postgres_create_tables
+
+    async def fake_send_message(chat_id, message):
+        await asyncio.sleep(tg_latency)
+
+    FakeHeadHunterAPI.latency = hh_latency
+    bot.chat.HeadHunterAPI = FakeHeadHunterAPI
+    bot.chat.send_message = fake_send_message
+
+    await postgres_connect()
+    await postgres_create_tables()
+
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    await seed_users(records)
+
+    loop = asyncio.get_event_loop()
+    latencies: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+
+    async def handle(msg: dict) -> None:
+        command = command_of(msg)
+        started = loop.time()
+        try:
+            await bot.chat.on_chat_message(msg)
+        except Exception as e:
+            log.error(f'Error handling replayed message: {e!r}', extra={'command': command})
+            errors[command] = errors.get(command, 0) + 1
+            return
+        latencies.setdefault(command, []).append(loop.time() - started)
+
+    tasks = []
+    started = loop.time()
+    offset = records[0]['t'] if records else 0
+    for record in records:
+        await asyncio.sleep(max(0.0, started + (record['t'] - offset) / speed - loop.time()))
+        tasks.append(loop.create_task(handle(record['message'])))
+
+    await asyncio.gather(*tasks)
+    await bot.chat.conversation_states.flush()
+
+    print_report(latencies, errors, loop.time() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Воспроизведение записанных сообщений Telegram.')
+    parser.add_argument('path', help='JSONL-файл, записанный с RECORD_UPDATES')
+    parser.add_argument('--database', required=True, help='отдельная база PostgreSQL для воспроизведения (не POSTGRES_DB)')
+    parser.add_argument('--speed', type=float, default=1, help='ускорение относительно записи')
+    parser.add_argument('--hh-latency', type=float, default=50, help='время ответа фиктивного hh.ru, мс')
+    parser.add_argument('--tg-latency', type=float, default=20, help='время ответа фиктивного Telegram, мс')
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(replay(args.path, args.database, args.speed, args.hh_latency / 1000, args.tg_latency / 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,56 +1,214 @@
-import logging
+from typing import Dict, List, Set, Tuple
 import asyncio
-import datetime
-import bot
-from bot.hh_api import HeadHunterAPI, HeadHunterAuthError, HeadHunterResumeUpdateError
-from bot.models import HeadHunterResume
+import os
+from datetime import timedelta
+from bot import events, expiry
+from bot.db import postgres_connect
+from bot.hh_api import (
+    HeadHunterAPI, HeadHunterAuthError, HeadHunterRequestError, HeadHunterResumeNotFoundError,
+    HeadHunterResumeUpdateError, HeadHunterUnavailableError
+)
+from bot.log import get_logger
+from bot.models import HeadHunterResume, ResumeID, TelegramUser, UserID
+from bot.profiling import dump, traced
+from bot.scheduler import rate_curve, spread
+from bot.telegram import send_message
+from bot.timestamps import utcnow
+from bot.token_validator import VALIDATION_INTERVAL, prune_invalid_tokens
 
-# logging
-log = logging.getLogger('hh-update-bot')
-log.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log = get_logger('toucher')
 
-ch = logging.StreamHandler()
-ch.setFormatter(formatter)
-log.addHandler(ch)
+TOUCH_WINDOW = int(os.environ.get('TOUCH_WINDOW_SECONDS', 15 * 60))
+"""Циклы поднятия резюме начинаются с этим шагом, и каждый распределяет резюме, готовые к поднятию
+в течение этого окна, в секундах."""
 
-pg_pool = None
+TOUCH_MAX_DELAY = int(os.environ.get('TOUCH_MAX_DELAY_SECONDS', 10 * 60))
+"""Максимальная задержка поднятия резюме относительно next_publish_at, в секундах."""
 
+TOUCH_RATE_BUCKET = int(os.environ.get('TOUCH_RATE_BUCKET_SECONDS', 60))
+"""Шаг кривой частоты запросов, которая пишется в лог для каждого цикла, в секундах."""
 
-resume_timed_out_message = 'Продвижение твоего резюме было автоматически прекращено.'
+ACTIVATION_RETRY_DELAY = 10
+"""Пауза перед повторной подпиской на события активации после ошибки, в секундах."""
+
+scheduled_touches: Set[ResumeID] = set()
+"""Резюме, поднятие которых уже запланировано (циклом или по событию активации); следующие циклы их пропускают."""
+
+resume_removed_message = ('Резюме <b>{title}</b> не найдено на hh.ru, поэтому я перестал его поднимать. '
+                          'Если это ошибка, снова выбери резюме командой /resumes.')
+
+
+@traced()
+async def touch_resume(api: HeadHunterAPI, resume: HeadHunterResume) -> None:
+    if resume.until < utcnow():
+        # timed out during the cycle; bot.expiry deactivates it and notifies the user
+        return
+
+    try:
+        has_updated, resume = await api.touch_resume(resume)
+        if has_updated:
+            log.info('Resume updated', extra={'user_id': resume.user_id, 'resume_id': resume.resume_id})
+        else:
+            log.info('Too often', extra={'user_id': resume.user_id, 'resume_id': resume.resume_id})
+
+        # after "too often" the stored next_publish_at is stale only if HH's snapshot has changed;
+        # otherwise the refetch was answered by 304 or matched the stored hash and nothing is written
+        await resume.update()
+    except HeadHunterResumeUpdateError:
+        log.info('Error updating resume', extra={'user_id': resume.user_id, 'resume_id': resume.resume_id})
+    except HeadHunterResumeNotFoundError:
+        log.info('Resume removed from HH, deactivating',
+                 extra={'user_id': resume.user_id, 'resume_id': resume.resume_id})
+        await resume.deactivate()
+        await send_message(resume.user_id, resume_removed_message.format(title=resume.title))
+
+
+async def touch_user_resumes(user: TelegramUser, planned: List[Tuple[float, HeadHunterResume]], started: float) -> None:
+    """Поднимает резюме пользователя в запланированное время через один клиент API hh.ru.
+
+    Клиент создается перед первым поднятием, а не в начале цикла, чтобы запросы к /me
+    тоже распределялись по окну. Запрос к /me пропускается, если токен недавно прошел проверку:
+    отозванный токен всё равно проявится ошибкой авторизации при публикации.
+
+    :param user: пользователь с токеном
+    :param planned: пары (задержка от начала цикла в секундах, резюме), упорядоченные по задержке
+    :param started: время начала цикла по часам event loop
+    """
+    loop = asyncio.get_event_loop()
+
+    async def wait(delay: float) -> None:
+        await asyncio.sleep(max(0.0, started + delay - loop.time()))
+
+    is_token_checked = user.token_checked_at is not None and user.token_checked_at > utcnow() - VALIDATION_INTERVAL
+
+    await wait(planned[0][0])
+
+    try:
+        async with await HeadHunterAPI.create(user.hh_token, check_token=not is_token_checked) as api:
+            if not is_token_checked:
+                await TelegramUser.mark_tokens_checked([user.user_id])
+
+            for delay, resume in planned:
+                await wait(delay)
+                await touch_resume(api, resume)
+    except HeadHunterAuthError:
+        log.info('Wrong token', extra={'user_id': user.user_id})
+        await prune_invalid_tokens({user.user_id: user.hh_token})
+    except HeadHunterRequestError as e:
+        log.warning('HH rejected a request, resumes skipped until the next cycle',
+                    extra={'user_id': user.user_id, 'status': e.status})
+    except HeadHunterUnavailableError:
+        log.warning('HH is unavailable, resumes skipped until the next cycle', extra={'user_id': user.user_id})
 
 
 async def touch_ready_resumes() -> None:
-    resumes_and_users = await HeadHunterResume.get_active_resume_list()
-
-    for user_id, user_resumes in resumes_and_users.items():
-        for r in user_resumes:
-            user = r['user']
-            resume = r['resume']
-
-            try:
-                async with await HeadHunterAPI.create(user.hh_token) as api:
-                    if resume.until < datetime.datetime.now():
-                        # notify user and deactivate resume
-                        await bot.send_message(user.user_id, resume_timed_out_message)
-                        await resume.deactivate()
-                    try:
-                        has_updated, resume = await api.touch_resume(resume)
-                        if has_updated:
-                            log.info(f'Resume updated: {resume.title} ({resume.resume_id})')
-                            resume.update()
-                        else:
-                            log.info(f'Too often: {resume.title} ({resume.resume_id})')
-                    except HeadHunterResumeUpdateError:
-                        log.info(f'Error updating resume: {resume.title} ({resume.resume_id})')
-            except HeadHunterAuthError:
-                log.info(f'Wrong token: {user.hh_token}')
-                continue
+    """Один цикл: поднимает резюме, которые станут готовы в течение окна, распределяя запросы по нему.
+
+    Циклы начинаются каждые TOUCH_WINDOW секунд, не дожидаясь окончания предыдущих: резюме,
+    ставшее готовым в момент d, попадает в цикл, начавшийся не позже d, и поднимается
+    не позже d + TOUCH_MAX_DELAY. Запланированные, но еще не поднятые резюме следующие циклы пропускают.
+    """
+    loop = asyncio.get_event_loop()
+    started = loop.time()
+    now = utcnow()
+
+    def due_in(user_and_resume: Tuple[TelegramUser, HeadHunterResume]) -> float:
+        return (user_and_resume[1].next_publish_at - now).total_seconds()
+
+    due_before = now + timedelta(seconds=TOUCH_WINDOW)
+    ready = [
+        (user, resume)
+        for user, resumes in await HeadHunterResume.get_active_resume_list(due_before=due_before)
+        for resume in resumes
+        if resume.resume_id not in scheduled_touches
+    ]
+
+    planned = spread(ready, due_in, TOUCH_WINDOW, TOUCH_MAX_DELAY)
+
+    curve = rate_curve([delay for delay, _ in planned], TOUCH_RATE_BUCKET)
+    log.info('Touch plan', extra={
+        'count': len(planned), 'window': TOUCH_WINDOW, 'bucket': TOUCH_RATE_BUCKET,
+        'peak': max(curve, default=0), 'curve': curve
+    })
+
+    users: Dict[UserID, Tuple[TelegramUser, List[Tuple[float, HeadHunterResume]]]] = {}
+    for delay, (user, resume) in planned:
+        users.setdefault(user.user_id, (user, []))[1].append((delay, resume))
+
+    resume_ids = [resume.resume_id for _, (_, resume) in planned]
+    scheduled_touches.update(resume_ids)
+    try:
+        results = await asyncio.gather(
+            *(touch_user_resumes(user, user_planned, started) for user, user_planned in users.values()),
+            return_exceptions=True
+        )
+    finally:
+        scheduled_touches.difference_update(resume_ids)
+
+    for result in results:
+        if isinstance(result, Exception):
+            log.error(f'Error touching resumes: {result!r}')
+
+
+async def touch_activated_resume(resume_id: ResumeID) -> None:
+    """Первое поднятие только что активированного резюме, не дожидаясь очередного цикла.
+
+    Если резюме станет готово к поднятию позже, чем через окно цикла, его поднимет обычный цикл.
+    """
+    loop = asyncio.get_event_loop()
+
+    users_and_resumes = await HeadHunterResume.get_active_resume_list(resume_id)
+    if not users_and_resumes:
+        return
+
+    user, (resume, ) = users_and_resumes[0]
+
+    due_in = max(0.0, (resume.next_publish_at - utcnow()).total_seconds())
+    if due_in >= TOUCH_WINDOW or resume_id in scheduled_touches:
+        log.info('Activated resume is not ready yet or already scheduled, leaving it to the regular cycle',
+                 extra={'resume_id': resume_id})
+        return
+
+    log.info('Touching activated resume', extra={'resume_id': resume_id, 'due_in': round(due_in)})
+    scheduled_touches.add(resume_id)
+    try:
+        await touch_user_resumes(user, [(due_in, resume)], loop.time())
+    except Exception as e:
+        log.error(f'Error touching activated resume: {e!r}', extra={'resume_id': resume_id})
+    finally:
+        scheduled_touches.discard(resume_id)
+
+
+async def listen_for_activations() -> None:
+    loop = asyncio.get_event_loop()
+
+    while True:
+        try:
+            async for resume_id in events.listen(events.RESUME_ACTIVATED_CHANNEL):
+                loop.create_task(touch_activated_resume(resume_id))
+        except Exception as e:
+            log.error(f'Error listening for activated resumes: {e!r}')
+            await asyncio.sleep(ACTIVATION_RETRY_DELAY)
+
+
+async def run_touch_cycle() -> None:
+    try:
+        await touch_ready_resumes()
+    except Exception as e:
+        log.error(f'Error in touch cycle: {e!r}')
 
 
 async def main():
+    await postgres_connect()
+
     loop = asyncio.get_event_loop()
+    loop.create_task(listen_for_activations())
+    loop.create_task(expiry.run())
 
-    log.info('Updating resumes in HH...')
-    loop.create_task(bot.postgres_connect())
-    loop.create_task(touch_ready_resumes())
+    # cycles start at a fixed cadence and overlap, so that no resume waits for the previous cycle to finish
+    while True:
+        log.info('Updating resumes in HH...')
+        started = loop.time()
+        loop.create_task(run_touch_cycle())
+        await asyncio.sleep(max(0.0, TOUCH_WINDOW - (loop.time() - started)))
+        dump('touch_cycle')
@@ -0,0 +1,93 @@
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+import math
+import random
+
+T = TypeVar('T')
+
+
+def place(earliest: Sequence[float], gap: float, phase: float, max_delay: float) -> Optional[List[float]]:
+    """Расставляет запуски по порядку с шагом не меньше gap, каждый — не раньше своей готовности.
+
+    :param earliest: моменты готовности, упорядоченные по возрастанию
+    :param gap: минимальный интервал между соседними запусками, в секундах
+    :param phase: момент, раньше которого не происходит ни один запуск
+    :param max_delay: максимальная задержка запуска относительно готовности, в секундах
+    :return: моменты запусков или None, если с таким шагом какой-то запуск опоздает больше чем на max_delay
+    """
+    placed = []
+    t = phase
+    for due in earliest:
+        t = max(t, due)
+        if t > due + max_delay:
+            return None
+        placed.append(t)
+        t += gap
+    return placed
+
+
+def spread(
+        items: Sequence[T],
+        due_in: Callable[[T], float],
+        window: float,
+        max_delay: float,
+        rng: random.Random=None
+) -> List[Tuple[float, T]]:
+    """Распределяет запуски с постоянной частотой, чтобы они не приходились на один момент.
+
+    Элементы упорядочиваются по времени готовности и запускаются по очереди с шагом gap,
+    каждый — не раньше своей готовности. Шаг равен window / n, а если с таким шагом какой-то запуск
+    отложился бы больше чем на max_delay после готовности, то наибольшему шагу, при котором
+    этого не происходит (например, когда много элементов уже готовы или готовы одновременно).
+    Начало расстановки сдвигается на случайную долю шага.
+
+    Так частота запусков нигде не превышает 1 / gap, а каждый элемент запускается внутри
+    своего интервала [готовность, готовность + max_delay].
+
+    :param items: элементы для запуска
+    :param due_in: через сколько секунд элемент будет готов к запуску (0 или меньше — уже готов)
+    :param window: длина окна в секундах
+    :param max_delay: максимальная задержка запуска относительно готовности, в секундах
+    :param rng: генератор случайных чисел
+    :return: пары (задержка от начала окна в секундах, элемент), упорядоченные по задержке
+    """
+    rng = rng or random
+
+    ordered = sorted(items, key=due_in)
+    if not ordered:
+        return []
+
+    earliest = [max(0.0, due_in(item)) for item in ordered]
+    jitter = rng.random()
+
+    gap = window / len(ordered)
+    placed = place(earliest, gap, jitter * gap, max_delay)
+    if placed is None:
+        # the largest gap that still meets every deadline; gap 0 always does
+        low, high = 0.0, gap
+        for _ in range(50):
+            middle = (low + high) / 2
+            if place(earliest, middle, jitter * middle, max_delay) is None:
+                high = middle
+            else:
+                low = middle
+        gap = low
+        placed = place(earliest, gap, jitter * gap, max_delay)
+
+    return list(zip(placed, ordered))
+
+
+def rate_curve(delays: Sequence[float], bucket: float) -> List[int]:
+    """Считает количество запусков в каждом интервале длиной bucket секунд.
+
+    :param delays: задержки запусков от начала окна в секундах
+    :param bucket: длина интервала в секундах
+    :return: количество запусков по интервалам, начиная с начала окна
+    """
+    if not delays:
+        return []
+
+    curve = [0] * (int(math.floor(max(delays) / bucket)) + 1)
+    for delay in delays:
+        curve[int(math.floor(delay / bucket))] += 1
+
+    return curve
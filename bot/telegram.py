@@ -0,0 +1,74 @@
+from typing import Iterable, List, Tuple
+import asyncio
+import os
+from bot.log import get_logger
+from bot.profiling import traced
+
+log = get_logger('telegram')
+
+SEND_RATE = float(os.environ.get('TELEGRAM_SEND_RATE', 25))
+"""Максимальное количество сообщений в секунду при массовой рассылке (Telegram допускает около 30)."""
+
+tg_bot = None
+
+
+class RateLimiter:
+    """Ограничитель частоты: пропускает не больше rate вызовов wait() в секунду, равномерно."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self.lock:
+            loop = asyncio.get_event_loop()
+            now = loop.time()
+            if self.next_at > now:
+                await asyncio.sleep(self.next_at - now)
+                now = self.next_at
+            self.next_at = now + self.interval
+
+
+def get_bot():
+    """Возвращает объект бота Telegram, создавая его при первом обращении.
+
+    telepot импортируется здесь же, чтобы процессы, которые только отправляют сообщения
+    (например, resume_toucher), не загружали его при старте.
+    """
+    global tg_bot
+
+    if tg_bot is None:
+        import telepot.aio
+
+        log.info('Creating Telegram bot...')
+        tg_bot = telepot.aio.Bot(os.environ['BOT_TOKEN'])
+
+    return tg_bot
+
+
+@traced()
+async def send_message(chat_id, message):
+    await get_bot().sendMessage(chat_id, message, parse_mode='HTML')
+
+
+async def send_messages(messages: Iterable[Tuple[int, str]], limiter: RateLimiter=None) -> List[int]:
+    """Рассылает сообщения с ограничением частоты; ошибка отправки одного сообщения не прерывает рассылку.
+
+    :param messages: пары (идентификатор чата, текст сообщения)
+    :param limiter: ограничитель частоты; по умолчанию SEND_RATE сообщений в секунду
+    :return: идентификаторы чатов, которым сообщения отправлены успешно
+    """
+    limiter = limiter or RateLimiter(SEND_RATE)
+
+    delivered = []
+    for chat_id, message in messages:
+        await limiter.wait()
+        try:
+            await send_message(chat_id, message)
+        except Exception as e:
+            log.error(f'Error sending message: {e!r}', extra={'user_id': chat_id})
+        else:
+            delivered.append(chat_id)
+
+    return delivered
@@ -0,0 +1,62 @@
+from typing import Dict
+from datetime import datetime, timedelta, timezone
+
+UTC = timezone.utc
+
+_offsets: Dict[str, timedelta] = {'Z': timedelta(0)}
+"""Кэш разобранных смещений часового пояса: в ответах hh.ru их всего несколько."""
+
+
+def _parse_offset(offset: str) -> timedelta:
+    if len(offset) == 5:
+        # +HHMM
+        hours, minutes = offset[1:3], offset[3:5]
+    elif len(offset) == 6 and offset[3] == ':':
+        # +HH:MM
+        hours, minutes = offset[1:3], offset[4:6]
+    else:
+        raise ValueError(f'Invalid UTC offset: {offset!r}')
+
+    if offset[0] not in '+-' or not (hours + minutes).isdigit():
+        raise ValueError(f'Invalid UTC offset: {offset!r}')
+
+    delta = timedelta(hours=int(hours), minutes=int(minutes))
+    return -delta if offset[0] == '-' else delta
+
+
+def parse_datetime(value: str) -> datetime:
+    """Разбирает время в формате API hh.ru: `YYYY-MM-DDTHH:MM:SS+ZZZZ`.
+
+    Также принимаются смещения вида `+ZZ:ZZ` и `Z`.
+
+    :param value: строка со временем
+    :raise ValueError: если строка не соответствует формату
+    :return: время с часовым поясом UTC
+    """
+    if len(value) < 20 or value[4] != '-' or value[7] != '-' or value[10] != 'T' or value[13] != ':' or value[16] != ':':
+        raise ValueError(f'Invalid hh.ru datetime: {value!r}')
+
+    offset = value[19:]
+    delta = _offsets.get(offset)
+    if delta is None:
+        delta = _offsets[offset] = _parse_offset(offset)
+
+    try:
+        local = datetime(
+            int(value[0:4]),
+            int(value[5:7]),
+            int(value[8:10]),
+            int(value[11:13]),
+            int(value[14:16]),
+            int(value[17:19]),
+            tzinfo=UTC
+        )
+    except ValueError:
+        raise ValueError(f'Invalid hh.ru datetime: {value!r}') from None
+
+    return local - delta
+
+
+def utcnow() -> datetime:
+    """Текущее время с часовым поясом UTC."""
+    return datetime.now(UTC)
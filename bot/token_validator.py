@@ -0,0 +1,83 @@
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+from datetime import timedelta
+from aiohttp import ClientSession, ClientTimeout
+from bot.db import postgres_connect
+from bot.hh_api import HeadHunterAPI
+from bot.log import get_logger
+from bot.models import TelegramUser, UserID
+from bot.telegram import send_message
+from bot.timestamps import utcnow
+
+log = get_logger('token_validator')
+
+VALIDATION_INTERVAL = timedelta(hours=int(os.environ.get('TOKEN_VALIDATION_INTERVAL_HOURS', 24)))
+"""Как часто перепроверять каждый токен."""
+
+VALIDATION_BATCH_SIZE = int(os.environ.get('TOKEN_VALIDATION_BATCH_SIZE', 1000))
+"""Максимальное количество токенов, проверяемых за один проход."""
+
+VALIDATION_CONCURRENCY = int(os.environ.get('TOKEN_VALIDATION_CONCURRENCY', 10))
+"""Максимальное количество одновременных запросов к /me."""
+
+VALIDATION_TIMEOUT = int(os.environ.get('TOKEN_VALIDATION_TIMEOUT', 10))
+"""Таймаут одного запроса к /me, в секундах."""
+
+VALIDATION_CHECK_INTERVAL = int(os.environ.get('TOKEN_VALIDATION_CHECK_INTERVAL_SECONDS', 60 * 60))
+"""Пауза между проходами проверки, в секундах."""
+
+token_revoked_message = ('Мой токен для доступа к hh.ru больше не работает, поэтому я перестал поднимать твои резюме. '
+                         'Отправь мне новый токен (его можно взять отсюда: https://dev.hh.ru/admin), '
+                         'а затем снова выбери резюме командой /resumes.')
+
+
+async def prune_invalid_tokens(tokens: Dict[UserID, str]) -> None:
+    """Помечает токены недействительными, деактивирует резюме и просит пользователей прислать новый токен.
+
+    :param tokens: отклоненные hh.ru токены по идентификаторам пользователей
+    """
+    user_ids = await TelegramUser.invalidate_tokens(tokens)
+
+    for user_id in user_ids:
+        log.info('Token is invalid, asking for a new one', extra={'user_id': user_id})
+        await send_message(user_id, token_revoked_message)
+
+
+async def validate_tokens() -> None:
+    """Проверяет давно не проверявшиеся токены и убирает недействительные."""
+    users = await TelegramUser.get_users_for_token_check(utcnow() - VALIDATION_INTERVAL, VALIDATION_BATCH_SIZE)
+    log.info('Validating tokens...', extra={'count': len(users)})
+
+    if not users:
+        return
+
+    semaphore = asyncio.Semaphore(VALIDATION_CONCURRENCY)
+
+    async with ClientSession(timeout=ClientTimeout(total=VALIDATION_TIMEOUT)) as session:
+        async def check(user: TelegramUser) -> Tuple[TelegramUser, Optional[bool]]:
+            async with semaphore:
+                return user, await HeadHunterAPI.check_token(session, user.hh_token)
+
+        results: List[Tuple[TelegramUser, Optional[bool]]] = await asyncio.gather(*(check(u) for u in users))
+
+    valid = [user.user_id for user, is_valid in results if is_valid]
+    invalid = {user.user_id: user.hh_token for user, is_valid in results if is_valid is False}
+    unknown = len(results) - len(valid) - len(invalid)
+
+    await TelegramUser.mark_tokens_checked(valid)
+    await prune_invalid_tokens(invalid)
+
+    log.info('Tokens validated', extra={'valid': len(valid), 'invalid': len(invalid), 'not_checked': unknown})
+
+
+async def main():
+    await postgres_connect()
+
+    while True:
+        try:
+            await validate_tokens()
+        except Exception as e:
+            log.error(f'Error validating tokens: {e!r}')
+
+        await asyncio.sleep(VALIDATION_CHECK_INTERVAL)
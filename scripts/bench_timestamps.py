@@ -0,0 +1,49 @@
+"""Микро-бенчмарк разбора времени из ответов hh.ru.
+
+Сравнивает bot.timestamps.parse_datetime с datetime.strptime
+и (если установлен) dateutil.parser.parse.
+
+Использование:
+    python scripts/bench_timestamps.py [--number N]
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.timestamps import parse_datetime  # noqa: E402
+
+SAMPLE = '2018-07-16T18:27:53+0300'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=100000, help='количество вызовов на один замер')
+    args = parser.parse_args()
+
+    candidates = {
+        'bot.timestamps.parse_datetime': lambda: parse_datetime(SAMPLE),
+        'datetime.strptime': lambda: datetime.strptime(SAMPLE, '%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+    try:
+        import dateutil.parser
+    except ImportError:
+        pass
+    else:
+        candidates['dateutil.parser.parse'] = lambda: dateutil.parser.parse(SAMPLE)
+
+    expected = parse_datetime(SAMPLE)
+    for name, fn in candidates.items():
+        assert fn() == expected, name
+
+    for name, fn in candidates.items():
+        best = min(timeit.repeat(fn, number=args.number, repeat=5))
+        print(f'{name:32} {best / args.number * 1e6:8.2f} us/call')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Проверка равномерности расписания поднятий bot.scheduler.spread.
+
+Для нескольких типичных сценариев (все резюме готовы одновременно, все уже просрочены,
+готовность равномерно распределена) проверяет, что каждый запуск попадает в свой интервал
+[готовность, готовность + max_delay] и что ни в одном интервале rate_curve запусков
+не больше средней частоты расписания.
+
+Использование:
+    python scripts/check_spread.py [--window S] [--max-delay S] [--bucket S]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.scheduler import rate_curve, spread  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--window', type=float, default=900, help='длина окна, с')
+    parser.add_argument('--max-delay', type=float, default=600, help='максимальная задержка, с')
+    parser.add_argument('--bucket', type=float, default=60, help='шаг кривой частоты, с')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    scenarios = {
+        'same due time': [800.0] * 100,
+        'all overdue': [-100.0] * 300,
+        'uniform': [rng.uniform(-300, args.window) for _ in range(500)],
+        'sparse': [rng.uniform(0, args.window) for _ in range(10)],
+    }
+
+    failed = False
+    for name, due in scenarios.items():
+        planned = spread(due, lambda d: d, args.window, args.max_delay, rng)
+        delays = [delay for delay, _ in planned]
+
+        late = [(delay, d) for delay, d in planned if not max(0.0, d) <= delay <= max(0.0, d) + args.max_delay + 1e-6]
+
+        gap = min((b - a for a, b in zip(delays, delays[1:])), default=args.window)
+        average = math.ceil(args.bucket / gap - 1e-9) if gap > 0 else len(delays)
+        curve = rate_curve(delays, args.bucket)
+        peak = max(curve, default=0)
+
+        ok = not late and peak <= average
+        failed = failed or not ok
+        print(f'{name:16} {"ok" if ok else "FAIL":4} n={len(delays)} out of range={len(late)} '
+              f'peak={peak} average={average} per {args.bucket:.0f} s, curve: {curve}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Отчёт о времени импорта точек входа бота.
+
+Запускает отдельный интерпретатор с `-X importtime` для каждой точки входа
+и печатает суммарное время импорта и самые тяжёлые модули верхнего уровня.
+
+Флаг `-X importtime` появился в Python 3.7, поэтому отчёт нужно запускать им или более новым.
+
+Использование:
+    python scripts/importtime.py [--top N]
+"""
+from typing import List, Tuple
+import argparse
+import os
+import subprocess
+import sys
+
+ENTRY_POINTS = {
+    'bot': 'bot.chat',
+    'touch': 'bot.resume_toucher',
+}
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module: str) -> List[Tuple[int, int, str]]:
+    """Импортирует модуль в чистом интерпретаторе и разбирает вывод `-X importtime`.
+
+    :param module: имя импортируемого модуля
+    :return: список (self, cumulative, имя модуля с отступом уровня вложенности), время в микросекундах
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+    rows = []
+    errors = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            errors.append(line)
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            # header
+            continue
+        rows.append((int(parts[0]), int(parts[1]), parts[2].rstrip()))
+
+    if proc.returncode != 0:
+        raise RuntimeError(f'Cannot import {module}:\n' + '\n'.join(errors))
+
+    return rows
+
+
+def report(name: str, module: str, top: int) -> None:
+    rows = measure(module)
+
+    # top-level imports have exactly one space of indentation in the module column
+    top_level = [r for r in rows if not r[2].startswith('  ')]
+    total = sum(r[1] for r in top_level)
+
+    print(f'{name} ({module}): {len(rows)} modules, {total / 1000:.1f} ms')
+    for self_us, cumulative_us, package in sorted(rows, key=lambda r: r[1], reverse=True)[:top]:
+        print(f'  {cumulative_us / 1000:8.1f} ms  {self_us / 1000:8.1f} ms  {package.strip()}')
+    print()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=15, help='количество самых тяжёлых модулей в отчёте')
+    args = parser.parse_args()
+
+    for name, module in ENTRY_POINTS.items():
+        try:
+            report(name, module, args.top)
+        except RuntimeError as e:
+            print(f'{name} ({module}): {e}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()